@@ -1,62 +1,219 @@
 import argparse
-import twitter
-import yaml
+import os
+import sys
 
-from twitterbyconfig.models import (
-    TwitterUser,
-    TwitterList,
-    MetaList,
-    TwitterAccount,
-)
 
-from twitterbyconfig.accountmerger import (
-    AccountMerger,
-)
-
-
-def CreateApi():
+def CreateApi(transport_config=None):
+  import twitter
+  import yaml
+  from twitterbyconfig.transport import ConfigureApi
   with open('secrets.yaml', 'r') as stream:
     try:
       secrets = yaml.safe_load(stream)
-      return twitter.Api(consumer_key=secrets['consumer_key'],
-                         consumer_secret=secrets['consumer_secret'],
-                         access_token_key=secrets['access_token_key'],
-                         access_token_secret=secrets['access_token_secret'])
+      api = twitter.Api(consumer_key=secrets['consumer_key'],
+                        consumer_secret=secrets['consumer_secret'],
+                        access_token_key=secrets['access_token_key'],
+                        access_token_secret=secrets['access_token_secret'])
+      return ConfigureApi(api, transport_config)
     except yaml.YAMLError as e:
       print('Error loading secrets.yaml: {0}'.format(e))
   return None
-    
+
+
+def ConfigCachePath(config_file):
+  '''Parsed config files are cached in a hidden file next to the config.'''
+  config_dir, config_name = os.path.split(config_file)
+  return os.path.join(config_dir, '.{0}.cache'.format(config_name))
+
+
+def MutationQueuePath(config_file):
+  '''Queued mutations are stored in a hidden file next to the config.'''
+  config_dir, config_name = os.path.split(config_file)
+  return os.path.join(config_dir, '.{0}.queue'.format(config_name))
+
+
+def MetaListStatePath(config_file):
+  '''Synced meta-list compositions are stored in a hidden file by the config.'''
+  config_dir, config_name = os.path.split(config_file)
+  return os.path.join(config_dir, '.{0}.metalists'.format(config_name))
+
+
+def HistoryPath(config_file):
+  '''Download snapshots are stored in a hidden directory by the config.'''
+  config_dir, config_name = os.path.split(config_file)
+  return os.path.join(config_dir, '.{0}.history'.format(config_name))
+
+
+def ConfigIncludes(config_file):
+  '''Returns the files included by the config, which cannot be rewritten.
+
+  Writing an account to a config puts everything in the one file, so
+  download and write back refuse to flatten a split config.
+  '''
+  from twitterbyconfig.configloader import ConfigCache, ConfigLoader
+  loader = ConfigLoader(cache=ConfigCache(ConfigCachePath(config_file)))
+  return loader.Includes(config_file)
+
+
+def ParseTime(value):
+  '''Parses an ISO 8601 date or datetime into a unix timestamp.'''
+  import datetime
+  return datetime.datetime.fromisoformat(value).timestamp()
+
 
 parser = argparse.ArgumentParser(
     description='Provides Twitter account management using a plaintext config file.')
-parser.add_argument('operation', type=str, choices=['download', 'sync'],
+parser.add_argument('operation', type=str,
+                    choices=['download', 'sync', 'drain', 'validate',
+                             'history'],
                     help=('The operation to perform: \n'
                           '    download: downloads account data from Twitter'
                           ' and outputs to your config file\n'
                           '    upload: updates account data in Twitter to'
-                          ' match your config file\n'))
+                          ' match your config file\n'
+                          '    drain: applies follows and list additions'
+                          ' queued by sync once daily limits allow\n'
+                          '    validate: checks your config file for errors'
+                          ' without contacting Twitter\n'
+                          '    history: prints what changed between two'
+                          ' downloads made with --record-history\n'))
 parser.add_argument('config_file', type=str, help='The address of your config file.')
+parser.add_argument('--estimate', action='store_true',
+                    help=('With sync, only print the predicted API calls and'
+                          ' minimum completion time without changing'
+                          ' anything.'))
+parser.add_argument('--rebuild-meta-lists', action='store_true',
+                    help=('With sync, rebuild meta-lists from the full'
+                          ' membership of their lists instead of applying'
+                          ' only the changes made to those lists.'))
+parser.add_argument('--wait', action='store_true',
+                    help=('With drain, wait for daily limits to reset and'
+                          ' keep going until the queue is empty.'))
+parser.add_argument('--record-history', action='store_true',
+                    help=('With download, also record a snapshot of the'
+                          ' account for the history operation. Unlike the'
+                          ' download itself this holds the whole account'
+                          ' in memory.'))
+parser.add_argument('--since', type=ParseTime,
+                    help=('With history, an ISO 8601 date or time to diff'
+                          ' from. Defaults to the download before the last'
+                          ' one.'))
+parser.add_argument('--until', type=ParseTime,
+                    help=('With history, an ISO 8601 date or time to diff'
+                          ' to. Defaults to the last download.'))
+parser.add_argument('--timeout', type=float, default=30,
+                    help='Seconds to wait for each Twitter API response.')
+parser.add_argument('--max-retries', type=int, default=5,
+                    help=('Retries for failed API reads and idempotent'
+                          ' writes, 0 to disable.'))
 
 
 if __name__ == '__main__':
   args = parser.parse_args()
-  api = CreateApi()
+  # Imports are deferred so validate does not pay for python-twitter or
+  # require secrets.
+  if args.operation == 'validate':
+    from twitterbyconfig.validator import ConfigValidator
+    # Not persisting the parse cache keeps validate free of side effects,
+    # e.g. when run as a pre-commit hook.
+    validator = ConfigValidator()
+    errors = validator.ValidateFile(args.config_file)
+    for error in errors:
+      print(error)
+    if errors:
+      sys.exit(1)
+    print('Config is valid: {0}'.format(args.config_file))
+    sys.exit(0)
+  if args.operation == 'history':
+    from twitterbyconfig.history import DescribeFact, HistoryStore
+    history = HistoryStore(HistoryPath(args.config_file))
+    timestamps = history.Timestamps()
+    if not timestamps:
+      print('No downloads recorded for: {0}, download with'
+            ' --record-history first.'.format(args.config_file))
+      sys.exit(0)
+    until = timestamps[-1] if args.until is None else args.until
+    since = args.since
+    if since is None:
+      since = timestamps[-2] if len(timestamps) > 1 else timestamps[0] - 1
+    added, removed = history.Diff(since, until)
+    for fact in added:
+      print('+ {0}'.format(DescribeFact(fact)))
+    for fact in removed:
+      print('- {0}'.format(DescribeFact(fact)))
+    print('{0} added, {1} removed.'.format(len(added), len(removed)))
+    sys.exit(0)
+  from twitterbyconfig.models import TwitterAccount
+  from twitterbyconfig.transport import TransportConfig
+  api = CreateApi(TransportConfig(timeout=args.timeout,
+                                  max_retries=args.max_retries))
   if args.operation == 'download':
+    from twitterbyconfig.streaming import StreamAccountToConfig
+    if ConfigIncludes(args.config_file):
+      print('Not downloading into {0}, it includes other config files which'
+            ' would be lost. Download into a new file instead.'.format(
+                args.config_file))
+      sys.exit(1)
     print('Performing download from TwitterAPI into config file...')
-    account = TwitterAccount.FromApi(api)
-    print('Account data downloaded, writing to file...')
-    account.WriteToConfig(args.config_file)
+    StreamAccountToConfig(api, args.config_file)
     print('File updated from TwitterAPI source: {0}'.format(args.config_file))
+    if args.record_history:
+      from twitterbyconfig.history import HistoryStore
+      changes = HistoryStore(HistoryPath(args.config_file)).Record(
+          TwitterAccount.ReadFromConfig(args.config_file))
+      print('Recorded snapshot in history, {0} changes.'.format(changes))
   elif args.operation == 'sync':
-    print('Reading account data from config file...')
-    config_account = TwitterAccount.ReadFromConfig(args.config_file)
-    print('Reading account data from Twitter API...')
-    api_account = TwitterAccount.FromApi(api)
-    account_merger = AccountMerger(api)
-    merged_account = account_merger.MergeAccounts(api_account, config_account)
-    write_back_to_config = (
-        input('Write back canonical follows/lists to config file? y/n: ') == 'y')
-    if write_back_to_config:
-      merged_account.WriteToConfig(args.config_file)
+    from twitterbyconfig.configloader import ConfigCache
+    from twitterbyconfig.accountmerger import AccountMerger
+    from twitterbyconfig.estimator import SyncEstimator
+    from twitterbyconfig.metaliststate import MetaListState
+    from twitterbyconfig.mutationqueue import MutationQueue
+    from twitterbyconfig.pipeline import ResolveAccount, SyncPipeline
+    meta_list_state = MetaListState(MetaListStatePath(args.config_file))
+    # Pending downloads are cancelled if the sync fails part way.
+    with SyncPipeline(api) as pipeline:
+      print('Reading account data from config file and Twitter API...')
+      config_account = pipeline.ReadConfig(
+          args.config_file,
+          cache=ConfigCache(ConfigCachePath(args.config_file)))
+      api_account = pipeline.DownloadAccount(config_account)
+      mutation_queue = MutationQueue(MutationQueuePath(args.config_file))
+      if args.estimate:
+        estimator = SyncEstimator(api, meta_list_state=meta_list_state,
+                                  mutation_queue=mutation_queue)
+        estimate = estimator.Estimate(ResolveAccount(api_account),
+                                      config_account.result())
+        for line in estimate.Summary():
+          print(line)
+      else:
+        account_merger = AccountMerger(
+            api, rebuild_meta_lists=args.rebuild_meta_lists,
+            mutation_queue=mutation_queue,
+            meta_list_state=meta_list_state)
+        merged_account = account_merger.MergeAccounts(api_account,
+                                                      config_account)
+        if mutation_queue.mutations:
+          print('{0} mutations queued, apply them later with: drain'.format(
+              len(mutation_queue.mutations)))
+        if ConfigIncludes(args.config_file):
+          print('Not writing back to {0}, it includes other config files'
+                ' which would be lost.'.format(args.config_file))
+        elif (input('Write back canonical follows/lists to config file? y/n: ')
+              == 'y'):
+          merged_account.WriteToConfig(args.config_file)
+  elif args.operation == 'drain':
+    from twitterbyconfig.configloader import ConfigCache
+    from twitterbyconfig.mutationqueue import MutationQueue, QueueDrainer
+    config_account = TwitterAccount.ReadFromConfig(
+        args.config_file, cache=ConfigCache(ConfigCachePath(args.config_file)))
+    mutation_queue = MutationQueue(MutationQueuePath(args.config_file))
+    # Skip anything removed from the config since it was queued.
+    mutation_queue.Prune(config_account)
+    mutation_queue.Save()
+    print('Draining {0} queued mutations...'.format(
+        len(mutation_queue.mutations)))
+    applied = QueueDrainer(api, mutation_queue).Drain(wait=args.wait)
+    print('Applied {0} mutations, {1} still queued.'.format(
+        applied, len(mutation_queue.mutations)))
   else:
     raise ValueError('Unsupported operation: {0}'.format(args.operation))
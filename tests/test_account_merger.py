@@ -0,0 +1,158 @@
+import os
+import tempfile
+import unittest
+import twitter
+import twitterbyconfig as tbc
+
+from unittest.mock import MagicMock, call, patch
+
+
+def _User(i):
+  return tbc.TwitterUser(id=i, username='user{0}'.format(i))
+
+
+class TestAccountMerger(unittest.TestCase):
+
+  def setUp(self):
+    self.mock_api = twitter.Api()
+    self.mock_api.CreateBlock = MagicMock(
+        side_effect=lambda screen_name: twitter.User.NewFromJsonDict(
+            {'id': 3, 'screen_name': screen_name}))
+    self.mock_api.DestroyBlock = MagicMock()
+    self.mock_api.CreateMute = MagicMock(
+        side_effect=lambda screen_name: twitter.User.NewFromJsonDict(
+            {'id': 4, 'screen_name': screen_name}))
+    self.mock_api.DestroyMute = MagicMock()
+    self.mock_api.CreateListsMember = MagicMock()
+    self.mock_api.DestroyListsMember = MagicMock()
+    self.merger = tbc.AccountMerger(self.mock_api)
+
+  def test_MergeBlocks(self):
+    with patch('builtins.input', return_value='a'):
+      blocks = self.merger._MergeBlocks([_User(1), _User(2)],
+                                        [_User(2), _User(3)])
+    self.mock_api.CreateBlock.assert_called_once_with(screen_name='user3')
+    self.mock_api.DestroyBlock.assert_called_once_with(screen_name='user1')
+    self.assertCountEqual(blocks, [_User(2), _User(3)])
+
+  def test_MergeFollows_UnchangedSkipsPrompts(self):
+    api_follows = [_User(1), _User(2)]
+    with patch('builtins.input') as prompt:
+      follows = self.merger._MergeFollows(api_follows,
+                                          [_User(2), _User(1)])
+    prompt.assert_not_called()
+    self.assertIs(follows, api_follows)
+
+  def test_MergeMutes_DoNothing(self):
+    with patch('builtins.input', return_value='n'):
+      mutes = self.merger._MergeMutes([_User(1)], [_User(4)])
+    self.mock_api.CreateMute.assert_not_called()
+    self.mock_api.DestroyMute.assert_not_called()
+    self.assertCountEqual(mutes, [_User(1)])
+
+  def test_MergeAccounts_MissingSectionsNotManaged(self):
+    api_account = tbc.TwitterAccount(follows=[], lists=[], meta_lists=[],
+                                     blocks=[_User(1)], mutes=[_User(2)])
+    config_account = tbc.TwitterAccount.FromConfigDict(
+        {'follows': [], 'lists': [], 'meta_lists': []})
+    with patch('builtins.input', return_value='a'):
+      merged = self.merger.MergeAccounts(api_account, config_account)
+    self.mock_api.DestroyBlock.assert_not_called()
+    self.mock_api.DestroyMute.assert_not_called()
+    self.assertIsNone(merged.blocks)
+    self.assertNotIn('blocks', merged.ToConfigDict())
+
+  def test_MergeAccounts_EmptySectionRemovesAll(self):
+    api_account = tbc.TwitterAccount(follows=[], lists=[], meta_lists=[],
+                                     blocks=[_User(1)], mutes=[_User(2)])
+    config_account = tbc.TwitterAccount.FromConfigDict(
+        {'follows': [], 'lists': [], 'meta_lists': [], 'blocks': []})
+    with patch('builtins.input', return_value='a'):
+      merged = self.merger.MergeAccounts(api_account, config_account)
+    self.mock_api.DestroyBlock.assert_called_once_with(screen_name='user1')
+    self.mock_api.DestroyMute.assert_not_called()
+    self.assertEqual(list(merged.blocks), [])
+
+  def _MetaListAccounts(self, config_list1_members):
+    list1 = tbc.TwitterList(id=10, name='list1', members=[_User(1), _User(2)])
+    list2 = tbc.TwitterList(id=20, name='list2', members=[_User(2), _User(3)])
+    meta = tbc.TwitterList(id=30, name='META: All',
+                           members=[_User(1), _User(2), _User(3)])
+    api_account = tbc.TwitterAccount(
+        follows=[], lists=[list1, list2],
+        meta_lists=[tbc.MetaList.FromTwitterList(meta)])
+    config_account = tbc.TwitterAccount(
+        follows=[],
+        lists=[tbc.TwitterList(name='list1', members=config_list1_members),
+               tbc.TwitterList(name='list2', members=[_User(2), _User(3)])],
+        meta_lists=[tbc.MetaList(name='META: All',
+                                 lists=['list1', 'list2'])])
+    return api_account, config_account
+
+  def test_MergeAccounts_PropagatesListDeltasToMetaLists(self):
+    # user1 leaves list1 and user4 joins it, user2 leaves list1 but stays on
+    # the meta-list through list2.
+    api_account, config_account = self._MetaListAccounts([_User(4)])
+    with patch('builtins.input', return_value='a'):
+      self.merger.MergeAccounts(api_account, config_account)
+    self.mock_api.CreateListsMember.assert_has_calls(
+        [call(list_id=10, screen_name='user4'),
+         call(list_id=30, screen_name='user4')], any_order=True)
+    self.assertEqual(self.mock_api.CreateListsMember.call_count, 2)
+    self.mock_api.DestroyListsMember.assert_has_calls(
+        [call(list_id=10, screen_name='user1'),
+         call(list_id=10, screen_name='user2'),
+         call(list_id=30, screen_name='user1')], any_order=True)
+    self.assertEqual(self.mock_api.DestroyListsMember.call_count, 3)
+
+  def test_MergeAccounts_DeclinedListChangesNotPropagated(self):
+    api_account, config_account = self._MetaListAccounts([_User(4)])
+    with patch('builtins.input', return_value='n'):
+      self.merger.MergeAccounts(api_account, config_account)
+    self.mock_api.CreateListsMember.assert_not_called()
+    self.mock_api.DestroyListsMember.assert_not_called()
+
+  def test_MergeAccounts_RebuildMetaLists(self):
+    api_account, config_account = self._MetaListAccounts(
+        [_User(1), _User(2)])
+    # Drop user3 from the meta-list, only a full rebuild notices.
+    api_account.meta_lists[0].twitter_list.members.pop()
+    merger = tbc.AccountMerger(self.mock_api, rebuild_meta_lists=True)
+    with patch('builtins.input', return_value='a'):
+      merger.MergeAccounts(api_account, config_account)
+    self.mock_api.CreateListsMember.assert_called_once_with(
+        list_id=30, screen_name='user3')
+    self.mock_api.DestroyListsMember.assert_not_called()
+
+
+  def test_MergeAccounts_RebuildsMetaListWhenListsChange(self):
+    tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp_dir.cleanup)
+    state_path = os.path.join(tmp_dir.name, '.twitter.yaml.metalists')
+    state = tbc.MetaListState(state_path)
+    state.Put(tbc.MetaList(name='META: All', lists=['list1']))
+    # META: All was synced from list1 alone and now also includes list2.
+    api_account, config_account = self._MetaListAccounts(
+        [_User(1), _User(2)])
+    api_account.meta_lists[0].twitter_list.members.pop()
+    merger = tbc.AccountMerger(self.mock_api, meta_list_state=state)
+    with patch('builtins.input', return_value='a'):
+      merger.MergeAccounts(api_account, config_account)
+    self.mock_api.CreateListsMember.assert_called_once_with(
+        list_id=30, screen_name='user3')
+    self.assertEqual(tbc.MetaListState(state_path).compositions,
+                     {'META: All': ['list1', 'list2']})
+
+  def test_MergeAccounts_DeclinedRebuildIsRetried(self):
+    state = tbc.MetaListState()
+    api_account, config_account = self._MetaListAccounts(
+        [_User(1), _User(2)])
+    api_account.meta_lists[0].twitter_list.members.pop()
+    merger = tbc.AccountMerger(self.mock_api, meta_list_state=state)
+    with patch('builtins.input', return_value='n'):
+      merger.MergeAccounts(api_account, config_account)
+    self.assertFalse(state.Matches(config_account.meta_lists[0]))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,140 @@
+import concurrent.futures
+import os
+import tempfile
+import unittest
+import twitterbyconfig as tbc
+
+from twitterbyconfig import configloader
+from unittest.mock import patch
+
+
+class TestConfigLoader(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+
+  def _Write(self, name, content):
+    path = os.path.join(self.tmp_dir.name, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as stream:
+      stream.write(content)
+    return path
+
+  def test_Load_Includes(self):
+    root = self._Write('twitter.yaml',
+                       'include:\n- lists/a.yaml\n- lists/b.yaml\n'
+                       'follows:\n- username: root\n')
+    self._Write('lists/a.yaml',
+                'include:\n- b.yaml\n'
+                'lists:\n- name: A\n  members:\n  - username: a\n')
+    self._Write('lists/b.yaml', 'follows:\n- username: b\n')
+    config = tbc.ConfigLoader().Load(root)
+    # b.yaml is included twice but only merged once.
+    self.assertEqual(config['follows'],
+                     [{'username': 'root'}, {'username': 'b'}])
+    self.assertEqual([l['name'] for l in config['lists']], ['A'])
+    # Sections no file has are left out rather than read as empty.
+    self.assertNotIn('blocks', config)
+
+  def test_Load_FailsOnCycle(self):
+    root = self._Write('a.yaml', 'include:\n- b.yaml\n')
+    self._Write('b.yaml', 'include:\n- a.yaml\n')
+    with self.assertRaises(ValueError):
+      tbc.ConfigLoader().Load(root)
+
+  def test_Load_FailsOnMalformedSections(self):
+    root = self._Write('twitter.yaml', 'include:\n- a.yaml\n')
+    self._Write('a.yaml', 'follows: nntaleb\n')
+    with self.assertRaisesRegex(ValueError, 'follows must be a list'):
+      tbc.ConfigLoader().Load(root)
+    self._Write('a.yaml', '- username: a\n')
+    with self.assertRaisesRegex(ValueError, 'must be a mapping'):
+      tbc.ConfigLoader().Load(root)
+
+  def test_Load_CachedFilesNotReparsed(self):
+    root = self._Write('twitter.yaml', 'include:\n- a.yaml\n')
+    fragment = self._Write('a.yaml', 'follows:\n- username: a\n')
+    cache_path = os.path.join(self.tmp_dir.name, '.cache')
+    tbc.ConfigLoader(cache=tbc.ConfigCache(cache_path)).Load(root)
+    # Touching a file without changing its content keeps the cached parse.
+    os.utime(fragment, ns=(1, 1))
+    with patch('twitterbyconfig.configloader._ParseYaml') as parse:
+      config = tbc.ConfigLoader(cache=tbc.ConfigCache(cache_path)).Load(root)
+    parse.assert_not_called()
+    self.assertEqual(config['follows'], [{'username': 'a'}])
+    # Changed content is re-parsed.
+    self._Write('a.yaml', 'follows:\n- username: b\n')
+    config = tbc.ConfigLoader(cache=tbc.ConfigCache(cache_path)).Load(root)
+    self.assertEqual(config['follows'], [{'username': 'b'}])
+
+  def test_ConfigCache_FailedSaveKeepsPreviousCache(self):
+    cache_path = os.path.join(self.tmp_dir.name, '.cache')
+    cache = tbc.ConfigCache(cache_path)
+    cache.Put('a.yaml', os.stat(self.tmp_dir.name), 'digest', {'follows': []})
+    cache.Save()
+    with open(cache_path, 'r') as stream:
+      saved = stream.read()
+    cache.Put('b.yaml', os.stat(self.tmp_dir.name), 'digest', {'x': object()})
+    cache.Save()
+    with open(cache_path, 'r') as stream:
+      self.assertEqual(stream.read(), saved)
+    self.assertEqual(os.listdir(self.tmp_dir.name), ['.cache'])
+
+  def _WriteSplitConfig(self):
+    self._Write('a.yaml', 'follows:\n- username: a\n')
+    self._Write('b.yaml', 'follows:\n- username: b\n')
+    return self._Write('twitter.yaml', 'include:\n- a.yaml\n- b.yaml\n')
+
+  def test_Load_SmallConfigParsedSerially(self):
+    root = self._WriteSplitConfig()
+    with patch('os.cpu_count', return_value=4), \
+         patch('concurrent.futures.ProcessPoolExecutor') as pool:
+      config = tbc.ConfigLoader().Load(root)
+    pool.assert_not_called()
+    self.assertEqual(config['follows'], [{'username': 'a'},
+                                         {'username': 'b'}])
+
+  def test_Load_LargeConfigParsedInParallel(self):
+    root = self._WriteSplitConfig()
+    with patch('os.cpu_count', return_value=4), \
+         patch('twitterbyconfig.configloader.PARALLEL_PARSE_MIN_BYTES', 1):
+      config = tbc.ConfigLoader().Load(root)
+    self.assertEqual(config['follows'], [{'username': 'a'},
+                                         {'username': 'b'}])
+
+  def test_Load_ParallelFromThread(self):
+    # SyncPipeline loads configs on a worker thread, the pool must not fork.
+    root = self._WriteSplitConfig()
+    with patch('os.cpu_count', return_value=4), \
+         patch('twitterbyconfig.configloader.PARALLEL_PARSE_MIN_BYTES', 1), \
+         concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+      config = executor.submit(tbc.ConfigLoader().Load, root).result()
+    self.assertEqual(config['follows'], [{'username': 'a'},
+                                         {'username': 'b'}])
+    self.assertEqual(
+        configloader._POOL_CONTEXT.get_start_method(), 'spawn')
+
+  def test_Includes(self):
+    root = self._WriteSplitConfig()
+    self.assertEqual(
+        tbc.ConfigLoader().Includes(root),
+        [os.path.join(self.tmp_dir.name, name)
+         for name in ('a.yaml', 'b.yaml')])
+    self.assertEqual(tbc.ConfigLoader().Includes(
+        os.path.join(self.tmp_dir.name, 'missing.yaml')), [])
+
+  def test_ReadFromConfig_WithIncludes(self):
+    root = self._Write('twitter.yaml',
+                       'include:\n- meta.yaml\n'
+                       'lists:\n- name: A\n  members:\n  - username: a\n')
+    self._Write('meta.yaml',
+                "meta_lists:\n- name: 'META: All'\n  is_private: true\n"
+                '  lists:\n  - A\n')
+    account = tbc.TwitterAccount.ReadFromConfig(root)
+    self.assertEqual(account.lists[0].name, 'A')
+    self.assertEqual(account.meta_lists[0].lists, ['A'])
+
+
+if __name__ == '__main__':
+  unittest.main()
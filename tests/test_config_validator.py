@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import twitterbyconfig as tbc
+
+
+class TestConfigValidator(unittest.TestCase):
+
+  def test_ValidateFile_SimpleAccount(self):
+    validator = tbc.ConfigValidator()
+    self.assertEqual(validator.ValidateFile('testdata/simple_account.yaml'),
+                     [])
+
+  def test_ValidateFile_MissingFile(self):
+    errors = tbc.ConfigValidator().ValidateFile('testdata/missing.yaml')
+    self.assertEqual(len(errors), 1)
+
+  def test_Validate_ReportsAllErrors(self):
+    config = {
+      'follows': [{'username': 'Twitter'}, {'username': 'twitter'}, {}],
+      'blocks': [{'username': 'TWITTER'}],
+      'lists': [
+          {'name': 'Social', 'members': [{'username': 'a'}]},
+          {'name': 'Social', 'members': []},
+          {'name': 'META Social', 'members': []},
+      ],
+      'meta_lists': [
+          {'name': 'Gaming', 'is_private': True, 'lists': ['Social']},
+          {'name': 'META: A', 'is_private': True,
+           'lists': ['Social', 'Missing', 'META: B', 'META: A']},
+          {'name': 'META: B', 'lists': []},
+      ],
+    }
+    errors = tbc.ConfigValidator().Validate(config)
+    self.assertCountEqual(errors, [
+        'Entry in follows has no username: {}',
+        'Duplicate @twitter in follows',
+        '@twitter is both followed and blocked',
+        'List "META Social" conflicts with meta-list requirements, names'
+        ' starting with META are reserved for meta_lists',
+        'Duplicate list "Social"',
+        'Invalid meta-list name (Gaming), must start with: META',
+        'Meta-list "META: A" includes undefined list "Missing"',
+        'Meta-list "META: A" includes meta-list "META: B", meta-lists can'
+        ' only include lists',
+        'Meta-list "META: A" includes itself',
+        'Meta-list "META: B" has no is_private',
+        'Meta-list "META: B" has no lists',
+    ])
+
+  def test_Validate_SectionsMustBeLists(self):
+    config = {
+      'follows': None,
+      'mutes': 'a',
+      'lists': [{'name': 'A', 'members': None}],
+      'meta_lists': [{'name': 'META: A', 'is_private': True, 'lists': 'Foo'}],
+    }
+    errors = tbc.ConfigValidator().Validate(config)
+    self.assertCountEqual(errors, [
+        'follows must be a list, got: None',
+        'mutes must be a list, got: a',
+        'Members of list "A" must be a list, got: None',
+        'Lists of meta-list "META: A" must be a list, got: Foo',
+    ])
+
+  def test_ValidateFile_NotAMapping(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, 'twitter.yaml')
+      with open(path, 'w') as stream:
+        stream.write('- username: a\n')
+      errors = tbc.ConfigValidator().ValidateFile(path)
+      self.assertEqual(len(errors), 1)
+      self.assertIn('config must be a mapping', errors[0])
+      # Validating leaves no cache file behind.
+      self.assertEqual(os.listdir(tmp_dir), ['twitter.yaml'])
+
+  def test_Validate_DoesNotImportPythonTwitter(self):
+    script = ('import sys; import twitterbyconfig.validator; '
+              'sys.exit(int("twitter" in sys.modules))')
+    self.assertEqual(subprocess.call([sys.executable, '-c', script]), 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
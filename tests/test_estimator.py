@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+import twitter
+import twitterbyconfig as tbc
+
+from twitter.ratelimit import EndpointRateLimit
+from unittest.mock import MagicMock, patch
+
+
+def _User(i):
+  return tbc.TwitterUser(id=i, username='user{0}'.format(i))
+
+
+class TestSyncEstimator(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    self.mock_api = twitter.Api()
+    self.mock_api.CheckRateLimit = MagicMock(
+        return_value=EndpointRateLimit(limit=15, remaining=15, reset=1000))
+    for method in ['CreateFriendship', 'DestroyFriendship', 'CreateList',
+                   'DestroyList', 'CreateListsMember', 'DestroyListsMember']:
+      setattr(self.mock_api, method, MagicMock())
+    self.estimator = tbc.SyncEstimator(self.mock_api, clock=lambda: 100)
+
+  def _Estimate(self, api_account, config_account):
+    with patch('builtins.input', side_effect=AssertionError('prompted')):
+      estimate = self.estimator.Estimate(api_account, config_account)
+    return {e.endpoint.name: e for e in estimate.endpoints}, estimate
+
+  def test_Estimate_CountsPlannedActions(self):
+    api_list = tbc.TwitterList(id=10, name='Stale',
+                               members=[_User(1), _User(2)])
+    api_account = tbc.TwitterAccount(follows=[_User(1), _User(2)],
+                                     lists=[api_list],
+                                     meta_lists=[])
+    config_list = tbc.TwitterList(name='New', members=[_User(1), _User(3)])
+    config_account = tbc.TwitterAccount(follows=[_User(1), _User(3)],
+                                        lists=[config_list],
+                                        meta_lists=[])
+    by_name, estimate = self._Estimate(api_account, config_account)
+    self.assertEqual(by_name['POST friendships/create'].calls, 1)
+    self.assertEqual(by_name['POST friendships/destroy'].calls, 1)
+    self.assertEqual(by_name['POST lists/create'].calls, 1)
+    self.assertEqual(by_name['POST lists/destroy'].calls, 1)
+    # Members of a newly created list are part of the plan.
+    self.assertEqual(by_name['POST lists/members/create'].calls, 2)
+    self.assertNotIn('POST lists/members/destroy', by_name)
+    self.assertEqual(by_name['GET friends/list'].calls, 1)
+    self.assertEqual(by_name['GET lists/members'].calls, 1)
+    self.assertEqual(estimate.MinSecs(), 0)
+
+  def test_Estimate_DoesNotMutate(self):
+    api_list = tbc.TwitterList(id=10, name='Social', members=[_User(1)])
+    api_account = tbc.TwitterAccount(follows=[_User(1)],
+                                     lists=[api_list],
+                                     meta_lists=[])
+    config_list = tbc.TwitterList(name='Social', members=[_User(2)])
+    config_account = tbc.TwitterAccount(follows=[_User(2)],
+                                        lists=[config_list],
+                                        meta_lists=[])
+    self._Estimate(api_account, config_account)
+    self.mock_api.CreateFriendship.assert_not_called()
+    self.mock_api.DestroyFriendship.assert_not_called()
+    self.mock_api.CreateListsMember.assert_not_called()
+    self.mock_api.DestroyListsMember.assert_not_called()
+    self.assertEqual(api_account.follows, [_User(1)])
+    self.assertEqual(api_list.members, [_User(1)])
+
+  def test_Estimate_BlocksAndMutes(self):
+    blocks = [_User(i) for i in range(5001)]
+    api_account = tbc.TwitterAccount(follows=[], lists=[], meta_lists=[],
+                                     blocks=blocks, mutes=[_User(1)])
+    config_account = tbc.TwitterAccount(follows=[], lists=[], meta_lists=[],
+                                        blocks=blocks[1:], mutes=[_User(2)])
+    by_name, _ = self._Estimate(api_account, config_account)
+    self.assertEqual(by_name['GET blocks/ids'].calls, 2)
+    self.assertEqual(by_name['GET users/lookup'].calls, 52)
+    self.assertEqual(by_name['POST blocks/destroy'].calls, 1)
+    self.assertNotIn('POST blocks/create', by_name)
+    self.assertEqual(by_name['POST mutes/users/create'].calls, 1)
+    self.assertEqual(by_name['POST mutes/users/destroy'].calls, 1)
+
+  def test_Estimate_MinSecsUnderQuota(self):
+    # 16 pages of friends exceeds the 15 remaining calls so the sync has to
+    # wait for the window to reset at t=1000.
+    follows = [_User(i) for i in range(16 * 200)]
+    api_account = tbc.TwitterAccount(follows=follows, lists=[], meta_lists=[])
+    config_account = tbc.TwitterAccount(follows=follows, lists=[],
+                                        meta_lists=[])
+    by_name, estimate = self._Estimate(api_account, config_account)
+    self.assertEqual(by_name['GET friends/list'].calls, 16)
+    self.assertEqual(by_name['GET friends/list'].min_secs, 900)
+    self.assertEqual(estimate.MinSecs(), 900)
+
+  def test_Estimate_DailyFollowCap(self):
+    follows = [_User(i) for i in range(401)]
+    api_account = tbc.TwitterAccount(follows=[], lists=[], meta_lists=[])
+    config_account = tbc.TwitterAccount(follows=follows, lists=[],
+                                        meta_lists=[])
+    by_name, _ = self._Estimate(api_account, config_account)
+    self.assertEqual(by_name['POST friendships/create'].calls, 401)
+    self.assertEqual(by_name['POST friendships/create'].min_secs, 24 * 60 * 60)
+
+  def test_Estimate_DailyFollowCapUsesQueueHistory(self):
+    queue = tbc.MutationQueue(os.path.join(self.tmp_dir.name, 'queue'),
+                              clock=lambda: 100)
+    # 395 follows were applied at t=50, leaving 5 until t=50 + 1 day.
+    queue.history['follow'] = [50] * 395
+    self.estimator = tbc.SyncEstimator(self.mock_api, clock=lambda: 100,
+                                       mutation_queue=queue)
+    api_account = tbc.TwitterAccount(follows=[], lists=[], meta_lists=[])
+    config_account = tbc.TwitterAccount(
+        follows=[_User(i) for i in range(5)], lists=[], meta_lists=[])
+    by_name, _ = self._Estimate(api_account, config_account)
+    self.assertEqual(by_name['POST friendships/create'].min_secs, 0)
+    config_account.follows.append(_User(5))
+    by_name, _ = self._Estimate(api_account, config_account)
+    self.assertEqual(by_name['POST friendships/create'].min_secs,
+                     50 + 24 * 60 * 60 - 100)
+
+
+if __name__ == '__main__':
+  unittest.main()
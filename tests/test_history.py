@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+import twitterbyconfig as tbc
+
+from twitterbyconfig import history
+
+
+def _Account(follows, members=()):
+  return tbc.TwitterAccount(
+      follows=[tbc.TwitterUser(username=u) for u in follows],
+      lists=[tbc.TwitterList(name='L', is_private=True,
+                             members=[tbc.TwitterUser(username=u)
+                                      for u in members])],
+      meta_lists=[tbc.MetaList(name='META: All', lists=['L'])])
+
+
+class TestHistoryStore(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    self.path = os.path.join(self.tmp_dir.name, '.twitter.yaml.history')
+
+  def test_AccountFacts(self):
+    self.assertEqual(history.AccountFacts(_Account(['a'], ['b'])), {
+      ('follow', 'a'),
+      ('list', 'L', True),
+      ('member', 'L', 'b'),
+      ('meta_list', 'META: All', 'L'),
+    })
+
+  def test_StateAt_ReplaysDeltasAcrossCheckpoints(self):
+    store = tbc.HistoryStore(self.path, checkpoint_interval=2)
+    for day in range(7):
+      changes = store.Record(_Account(['u{0}'.format(i) for i in range(day)]),
+                             timestamp=day * 10.0)
+      self.assertEqual(changes, 1 if day else 2)
+    # A checkpoint followed by 2 deltas per segment.
+    self.assertEqual(len(os.listdir(self.path)), 4)
+    store = tbc.HistoryStore(self.path)
+    self.assertEqual(store.StateAt(-1), set())
+    for day in range(7):
+      self.assertEqual(store.StateAt(day * 10.0 + 5),
+                       history.AccountFacts(_Account(
+                           ['u{0}'.format(i) for i in range(day)])))
+
+  def test_Diff(self):
+    store = tbc.HistoryStore(self.path, checkpoint_interval=1)
+    store.Record(_Account(['a', 'b'], ['a']), timestamp=1.0)
+    store.Record(_Account(['b'], ['a']), timestamp=2.0)
+    store.Record(_Account(['b', 'c'], ['c']), timestamp=3.0)
+    self.assertEqual(store.Diff(1.0, 3.0),
+                     ([('follow', 'c'), ('member', 'L', 'c')],
+                      [('follow', 'a'), ('member', 'L', 'a')]))
+    self.assertEqual(store.Diff(2.0, 2.5), ([], []))
+
+  def test_Record_RejectsOlderTimestamp(self):
+    store = tbc.HistoryStore(self.path)
+    store.Record(_Account(['a']), timestamp=2.0)
+    with self.assertRaises(ValueError):
+      store.Record(_Account(['a']), timestamp=1.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,196 @@
+import os
+import tempfile
+import unittest
+import twitter
+import twitterbyconfig as tbc
+
+from twitterbyconfig import mutationqueue
+from unittest.mock import MagicMock, call, patch
+
+
+def _QuotaError():
+  return twitter.TwitterError(
+      [{'code': 161, 'message': 'You are unable to follow more people.'}])
+
+
+class _Clock:
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+  def Sleep(self, secs):
+    self.now += secs
+
+
+class TestMutationQueue(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    self.path = os.path.join(self.tmp_dir.name, '.twitter.yaml.queue')
+    self.clock = _Clock()
+    self.queue = tbc.MutationQueue(self.path, clock=self.clock)
+
+  def test_SaveAndLoad(self):
+    self.queue.Enqueue(tbc.Mutation(action='follow', username='a'))
+    self.queue.Enqueue(tbc.Mutation(action='follow', username='a'))
+    self.queue.RecordApplied('follow')
+    self.queue.Save()
+    queue = tbc.MutationQueue(self.path, clock=self.clock)
+    self.assertEqual(queue.mutations,
+                     [tbc.Mutation(action='follow', username='a',
+                                   enqueued_at=1000.0)])
+    self.assertEqual(queue.history['follow'], [1000.0])
+
+  def test_Pending_FollowsFirstThenOldest(self):
+    self.queue.Enqueue(tbc.Mutation(action='add_list_member', username='a',
+                                    list_id=1, list_name='L'))
+    self.clock.now += 1
+    self.queue.Enqueue(tbc.Mutation(action='follow', username='b'))
+    self.clock.now += 1
+    self.queue.Enqueue(tbc.Mutation(action='follow', username='c'))
+    self.assertEqual([m.username for m in self.queue.Pending()],
+                     ['b', 'c', 'a'])
+
+  def test_HasQuota_RollingDailyCap(self):
+    with patch.dict(mutationqueue.DAILY_CAPS, {'follow': 2}):
+      self.queue.RecordApplied('follow')
+      self.clock.now += 10
+      self.queue.RecordApplied('follow')
+      self.assertFalse(self.queue.HasQuota('follow'))
+      self.queue.Enqueue(tbc.Mutation(action='follow', username='a'))
+      self.assertEqual(self.queue.NextQuotaTime(),
+                       1000.0 + mutationqueue.DAY_SECS)
+      self.clock.now = 1000.0 + mutationqueue.DAY_SECS + 1
+      self.assertTrue(self.queue.HasQuota('follow'))
+    self.assertTrue(self.queue.HasQuota('unfollow'))
+
+  def test_Quota(self):
+    with patch.dict(mutationqueue.DAILY_CAPS, {'follow': 3}):
+      self.assertEqual(self.queue.Quota('follow'),
+                       (3, 1000.0 + mutationqueue.DAY_SECS))
+      self.queue.RecordApplied('follow')
+      self.clock.now += 10
+      self.assertEqual(self.queue.Quota('follow'),
+                       (2, 1000.0 + mutationqueue.DAY_SECS))
+      self.queue.RecordQuotaError('follow')
+      self.assertEqual(self.queue.Quota('follow'),
+                       (0, 1010.0 + mutationqueue.QUOTA_ERROR_BACKOFF_SECS))
+
+  def test_Prune(self):
+    for mutation in [
+        tbc.Mutation(action='follow', username='kept'),
+        tbc.Mutation(action='follow', username='dropped'),
+        tbc.Mutation(action='add_list_member', username='kept',
+                     list_id=1, list_name='L'),
+        tbc.Mutation(action='add_list_member', username='dropped',
+                     list_id=1, list_name='L'),
+        tbc.Mutation(action='add_list_member', username='kept',
+                     list_id=2, list_name='META: All')]:
+      self.queue.Enqueue(mutation)
+    account = tbc.TwitterAccount(
+        follows=[tbc.TwitterUser(username='kept')],
+        lists=[tbc.TwitterList(name='L',
+                               members=[tbc.TwitterUser(username='kept')])],
+        meta_lists=[tbc.MetaList(name='META: All', lists=['L'])])
+    self.queue.Prune(account)
+    self.assertEqual([(m.username, m.list_id) for m in self.queue.mutations],
+                     [('kept', None), ('kept', 1), ('kept', 2)])
+
+
+class TestQueueDrainer(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    self.clock = _Clock()
+    self.queue = tbc.MutationQueue(
+        os.path.join(self.tmp_dir.name, '.twitter.yaml.queue'),
+        clock=self.clock)
+    self.mock_api = twitter.Api()
+    self.mock_api.CreateFriendship = MagicMock()
+    self.mock_api.CreateListsMember = MagicMock()
+    self.drainer = tbc.QueueDrainer(self.mock_api, self.queue,
+                                    sleep=self.clock.Sleep)
+
+  def test_Drain_StopsAtCap(self):
+    for username in ['a', 'b', 'c']:
+      self.queue.Enqueue(tbc.Mutation(action='follow', username=username))
+    self.queue.Enqueue(tbc.Mutation(action='add_list_member', username='a',
+                                    list_id=1, list_name='L'))
+    with patch.dict(mutationqueue.DAILY_CAPS, {'follow': 2}):
+      self.assertEqual(self.drainer.Drain(), 3)
+    self.mock_api.CreateFriendship.assert_has_calls(
+        [call(screen_name='a'), call(screen_name='b')])
+    self.mock_api.CreateListsMember.assert_called_once_with(
+        list_id=1, screen_name='a')
+    self.assertEqual([m.username for m in self.queue.mutations], ['c'])
+    # The remaining state survives to the next run.
+    queue = tbc.MutationQueue(self.queue.path, clock=self.clock)
+    self.assertEqual(len(queue.mutations), 1)
+
+  def test_Drain_WaitsForQuota(self):
+    self.mock_api.CreateFriendship.side_effect = [_QuotaError(), None]
+    self.queue.Enqueue(tbc.Mutation(action='follow', username='a'))
+    self.assertEqual(self.drainer.Drain(wait=True), 1)
+    self.assertEqual(self.clock.now,
+                     1000.0 + mutationqueue.QUOTA_ERROR_BACKOFF_SECS)
+    self.assertEqual(self.queue.mutations, [])
+
+  def test_Drain_DropsFailedMutations(self):
+    self.mock_api.CreateFriendship.side_effect = twitter.TwitterError(
+        [{'code': 108, 'message': 'Cannot find specified user.'}])
+    self.queue.Enqueue(tbc.Mutation(action='follow', username='a'))
+    self.assertEqual(self.drainer.Drain(), 0)
+    self.assertEqual(self.queue.mutations, [])
+
+
+class TestAccountMergerQueueing(unittest.TestCase):
+
+  def test_MergeAccounts_QueuesOverQuota(self):
+    tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp_dir.cleanup)
+    queue = tbc.MutationQueue(os.path.join(tmp_dir.name, 'queue'))
+    mock_api = twitter.Api()
+    mock_api.CreateFriendship = MagicMock(
+        side_effect=[twitter.User.NewFromJsonDict({'id': 1,
+                                                   'screen_name': 'a'}),
+                     _QuotaError()])
+    api_account = tbc.TwitterAccount(follows=[], lists=[], meta_lists=[])
+    config_account = tbc.TwitterAccount(
+        follows=[tbc.TwitterUser(username=u) for u in ['a', 'b', 'c']],
+        lists=[], meta_lists=[])
+    merger = tbc.AccountMerger(mock_api, mutation_queue=queue)
+    with patch('builtins.input', return_value='a'):
+      merged = merger.MergeAccounts(api_account, config_account)
+    # The quota error blocks follows so the last one is queued untried.
+    self.assertEqual(mock_api.CreateFriendship.call_count, 2)
+    self.assertCountEqual([m.username for m in queue.mutations], ['b', 'c'])
+    # Queued follows are kept for writing back to the config.
+    self.assertCountEqual([u.username for u in merged.follows],
+                          ['a', 'b', 'c'])
+    self.assertEqual(
+        len(tbc.MutationQueue(queue.path).mutations), 2)
+
+  def test_MergeAccounts_RemovesMutationsAppliedDirectly(self):
+    tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp_dir.cleanup)
+    queue = tbc.MutationQueue(os.path.join(tmp_dir.name, 'queue'))
+    queue.Enqueue(tbc.Mutation(action='follow', username='a'))
+    mock_api = twitter.Api()
+    mock_api.CreateFriendship = MagicMock(
+        return_value=twitter.User.NewFromJsonDict({'id': 1,
+                                                   'screen_name': 'a'}))
+    api_account = tbc.TwitterAccount(follows=[], lists=[], meta_lists=[])
+    config_account = tbc.TwitterAccount(
+        follows=[tbc.TwitterUser(username='a')], lists=[], meta_lists=[])
+    merger = tbc.AccountMerger(mock_api, mutation_queue=queue)
+    with patch('builtins.input', return_value='a'):
+      merger.MergeAccounts(api_account, config_account)
+    self.assertEqual(tbc.MutationQueue(queue.path).mutations, [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,111 @@
+import threading
+import unittest
+import twitter
+import twitterbyconfig as tbc
+
+from twitterbyconfig import pipeline
+from unittest.mock import MagicMock, patch
+
+
+def _User(i):
+  return twitter.User.NewFromJsonDict(
+      {'id': i, 'screen_name': 'user{0}'.format(i)})
+
+
+class TestSyncPipeline(unittest.TestCase):
+
+  def setUp(self):
+    self.mock_api = twitter.Api()
+    self.mock_api.GetFriends = MagicMock(return_value=[_User(1)])
+    self.mock_api.GetLists = MagicMock(return_value=[
+        twitter.List.NewFromJsonDict(
+            {'id': 10, 'name': 'Slow', 'mode': 'private'}),
+        twitter.List.NewFromJsonDict(
+            {'id': 20, 'name': 'META: All', 'mode': 'public'})])
+    self.members_released = threading.Event()
+    def GetListMembers(list_id):
+      if list_id == 10 and not self.members_released.wait(timeout=5):
+        raise AssertionError('List members waited on the follows merge')
+      return [_User(2)]
+    self.mock_api.GetListMembers = MagicMock(side_effect=GetListMembers)
+    self.mock_api.GetBlocksIDsPaged = MagicMock(return_value=(0, 0, [3]))
+    self.mock_api.GetMutesIDsPaged = MagicMock(return_value=(0, 0, []))
+    self.mock_api.UsersLookup = MagicMock(return_value=[_User(3)])
+    self.pipeline = tbc.SyncPipeline(self.mock_api)
+    self.addCleanup(self.pipeline.Close)
+
+  def test_ResolveAccount_MatchesFromApi(self):
+    self.members_released.set()
+    account = pipeline.ResolveAccount(self.pipeline.DownloadAccount())
+    self.assertEqual(account, tbc.TwitterAccount.FromApi(self.mock_api))
+
+  def test_DownloadAccount_UnmanagedSectionsNotDownloaded(self):
+    self.members_released.set()
+    config_account = self.pipeline.executor.submit(
+        tbc.TwitterAccount, follows=[], lists=[], meta_lists=[])
+    account = pipeline.ResolveAccount(
+        self.pipeline.DownloadAccount(config_account))
+    self.assertIsNone(account.blocks)
+    self.assertIsNone(account.mutes)
+    self.mock_api.GetBlocksIDsPaged.assert_not_called()
+    self.mock_api.GetMutesIDsPaged.assert_not_called()
+    self.mock_api.UsersLookup.assert_not_called()
+
+  def test_DownloadAccount_BlocksAndMutesAfterListMembers(self):
+    self.members_released.set()
+    calls = []
+    for method in ['GetFriends', 'GetLists', 'GetListMembers',
+                   'GetBlocksIDsPaged', 'GetMutesIDsPaged']:
+      mock = getattr(self.mock_api, method)
+      mock.side_effect = self._Recorded(calls, method, mock.side_effect,
+                                        mock.return_value)
+    single_worker = tbc.SyncPipeline(self.mock_api, max_workers=1)
+    self.addCleanup(single_worker.Close)
+    config_account = tbc.TwitterAccount(follows=[], lists=[], meta_lists=[],
+                                        blocks=[], mutes=[])
+    pipeline.ResolveAccount(single_worker.DownloadAccount(config_account))
+    self.assertEqual(calls, ['GetFriends', 'GetLists', 'GetListMembers',
+                             'GetListMembers', 'GetBlocksIDsPaged',
+                             'GetMutesIDsPaged'])
+
+  def _Recorded(self, calls, name, side_effect, return_value):
+    def Call(*args, **kwargs):
+      calls.append(name)
+      return side_effect(*args, **kwargs) if side_effect else return_value
+    return Call
+
+  def test_ReadConfig(self):
+    self.assertEqual(
+        self.pipeline.ReadConfig('testdata/simple_account.yaml').result(),
+        tbc.TwitterAccount.ReadFromConfig('testdata/simple_account.yaml'))
+
+  def test_MergeAccounts_MergesFollowsBeforeListsArrive(self):
+    # Following user4 releases the slow list, so the sync only completes if
+    # follows are merged while the list members are still downloading.
+    def CreateFriendship(screen_name):
+      self.members_released.set()
+      return twitter.User.NewFromJsonDict({'id': 4,
+                                           'screen_name': screen_name})
+    self.mock_api.CreateFriendship = MagicMock(side_effect=CreateFriendship)
+    self.mock_api.DestroyList = MagicMock()
+    config_account = tbc.TwitterAccount(
+        follows=[tbc.TwitterUser(username='user1'),
+                 tbc.TwitterUser(username='user4')],
+        lists=[tbc.TwitterList(name='Slow',
+                               members=[tbc.TwitterUser(username='user2')])],
+        meta_lists=[],
+        blocks=[tbc.TwitterUser(username='user3')])
+    api_account = self.pipeline.DownloadAccount()
+    with patch('builtins.input', return_value='a'):
+      merged = tbc.AccountMerger(self.mock_api).MergeAccounts(
+          api_account, config_account)
+    self.mock_api.DestroyList.assert_called_once_with(list_id=20)
+    self.assertCountEqual([u.username for u in merged.follows],
+                          ['user1', 'user4'])
+    self.assertEqual([(l.name, [u.username for u in l.members])
+                      for l in merged.lists], [('Slow', ['user2'])])
+    self.assertEqual([u.username for u in merged.blocks], ['user3'])
+
+
+if __name__ == '__main__':
+  unittest.main()
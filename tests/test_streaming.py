@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+import twitter
+import twitterbyconfig as tbc
+
+from unittest.mock import MagicMock
+
+
+def _PtUser(i, screen_name):
+  return twitter.User.NewFromJsonDict({'id': i, 'screen_name': screen_name})
+
+
+class TestStreamAccountToConfig(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    names = ['zeta', 'Alpha', 'alpha', 'yes', '123', 'Beta_2', 'null',
+             'x' * 60, '_under', 'ALPHA', 'gamma']
+    self.users = [_PtUser(i, name) for i, name in enumerate(names)]
+    self.mock_api = twitter.Api()
+    # Paged endpoints used when streaming.
+    self.mock_api.GetFriendsPaged = MagicMock(side_effect=self._Pages(
+        self.users, 4))
+    self.mock_api.GetListMembersPaged = MagicMock(
+        side_effect=lambda list_id, **kwargs: self._Page(
+            self.members[list_id], 3, kwargs['cursor']))
+    self.mock_api.GetBlocksIDsPaged = MagicMock(side_effect=self._Pages(
+        [u.id for u in self.users[:7]], 2))
+    self.mock_api.GetMutesIDsPaged = MagicMock(return_value=(0, 0, []))
+    self.mock_api.UsersLookup = MagicMock(
+        side_effect=lambda user_id: [self.users[i] for i in user_id])
+    # Non-paged endpoints used by TwitterAccount.FromApi.
+    self.mock_api.GetFriends = MagicMock(return_value=self.users)
+    self.mock_api.GetListMembers = MagicMock(
+        side_effect=lambda list_id: self.members[list_id])
+    lists = [
+        twitter.List.NewFromJsonDict(
+            {'id': 10, 'name': 'zLast', 'mode': 'public'}),
+        twitter.List.NewFromJsonDict(
+            {'id': 20, 'name': 'A long list name ' * 6, 'mode': 'private'}),
+        twitter.List.NewFromJsonDict(
+            {'id': 30, 'name': 'Empty', 'mode': 'private'}),
+    ]
+    self.mock_api.GetLists = MagicMock(return_value=lists)
+    self.members = {10: self.users[::-1], 20: self.users[2:6], 30: []}
+
+  def _Page(self, items, size, cursor):
+    start = 0 if cursor == -1 else cursor
+    end = start + size
+    return (end if end < len(items) else 0, start, items[start:end])
+
+  def _Pages(self, items, size):
+    return lambda cursor, **kwargs: self._Page(items, size, cursor)
+
+  def _Read(self, path):
+    with open(path, 'r') as stream:
+      return stream.read()
+
+  def test_ByteIdenticalToWriteToConfig(self):
+    expected_path = os.path.join(self.tmp_dir.name, 'expected.yaml')
+    tbc.TwitterAccount.FromApi(self.mock_api).WriteToConfig(expected_path)
+    for run_size in [1, 2, 1000]:
+      path = os.path.join(self.tmp_dir.name, 'streamed.yaml')
+      tbc.StreamAccountToConfig(self.mock_api, path, run_size=run_size)
+      self.assertEqual(self._Read(path), self._Read(expected_path))
+
+  def test_FailedDownloadKeepsConfig(self):
+    path = os.path.join(self.tmp_dir.name, 'twitter.yaml')
+    with open(path, 'w') as stream:
+      stream.write('follows: []\n')
+    self.mock_api.GetLists = MagicMock(side_effect=twitter.TwitterError('x'))
+    with self.assertRaises(twitter.TwitterError):
+      tbc.StreamAccountToConfig(self.mock_api, path)
+    self.assertEqual(self._Read(path), 'follows: []\n')
+    self.assertEqual(os.listdir(self.tmp_dir.name), ['twitter.yaml'])
+
+
+class TestExternalSorter(unittest.TestCase):
+
+  def test_Lines_StableAcrossRuns(self):
+    records = [('b', 'b1'), ('a', 'a1'), ('b', 'b2'), ('a', 'a2'),
+               ('c', 'c1'), ('a', 'a3')]
+    sorter = tbc.ExternalSorter(run_size=2)
+    for key, line in records:
+      sorter.Add(key, line)
+    self.assertEqual(len(sorter.runs), 3)
+    self.assertEqual(list(sorter.Lines()),
+                     [line for _, line in sorted(records,
+                                                 key=lambda r: r[0])])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,165 @@
+import gzip
+import http.server
+import json
+import threading
+import unittest
+import requests
+import twitter
+import twitterbyconfig as tbc
+
+from unittest.mock import patch
+
+
+class _StandInHandler(http.server.BaseHTTPRequestHandler):
+  '''Fails the first `failures` requests to each path with a 503.
+
+  Paths in `not_found` are then answered with Twitter's not found error.
+  '''
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    self._Respond()
+
+  def do_POST(self):
+    self.rfile.read(int(self.headers.get('Content-Length', 0)))
+    self._Respond()
+
+  def _Respond(self):
+    server = self.server
+    path = self.path.split('?')[0]
+    server.requests.append((self.command, path))
+    server.connections.add(self.client_address)
+    if server.requests.count((self.command, path)) <= server.failures:
+      self._Send(503, b'{}')
+      return
+    if path in server.not_found:
+      self._Send(404, json.dumps({'errors': [
+          {'code': 34, 'message': 'Sorry, that page does not exist.'}]}
+          ).encode())
+      return
+    body = json.dumps(
+        {'ids': [1, 2, 3], 'next_cursor': 0, 'previous_cursor': 0}).encode()
+    encoded = 'gzip' in self.headers.get('Accept-Encoding', '')
+    self._Send(200, gzip.compress(body) if encoded else body,
+               {'Content-Encoding': 'gzip'} if encoded else {})
+
+  def _Send(self, status, body, headers={}):
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    for key, value in headers.items():
+      self.send_header(key, value)
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+
+class TestRetryingSession(unittest.TestCase):
+
+  def setUp(self):
+    self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                  _StandInHandler)
+    self.server.requests = []
+    self.server.connections = set()
+    self.server.failures = 0
+    self.server.not_found = set()
+    thread = threading.Thread(target=self.server.serve_forever,
+                              kwargs={'poll_interval': 0.01}, daemon=True)
+    thread.start()
+    self.addCleanup(self.server.server_close)
+    self.addCleanup(self.server.shutdown)
+    self.base_url = 'http://127.0.0.1:{0}/1.1'.format(
+        self.server.server_address[1])
+    self.sleeps = []
+    self.session = tbc.RetryingSession(
+        tbc.TransportConfig(max_retries=3, backoff_base_secs=1),
+        sleep=self.sleeps.append,
+        rand=lambda: 0.5)
+    self.addCleanup(self.session.close)
+
+  def test_Request_KeepAliveAndGzip(self):
+    for _ in range(3):
+      resp = self.session.get(self.base_url + '/friends/ids.json')
+      self.assertEqual(resp.json()['ids'], [1, 2, 3])
+    self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+    self.assertEqual(len(self.server.requests), 3)
+    self.assertEqual(len(self.server.connections), 1)
+
+  def test_Request_RetriesReadsWithBackoff(self):
+    self.server.failures = 2
+    resp = self.session.get(self.base_url + '/friends/ids.json')
+    self.assertEqual(resp.status_code, 200)
+    self.assertEqual(len(self.server.requests), 3)
+    self.assertEqual(self.sleeps, [0.5, 1.0])
+
+  def test_Request_GivesUpAfterMaxRetries(self):
+    self.server.failures = 10
+    resp = self.session.get(self.base_url + '/friends/ids.json')
+    self.assertEqual(resp.status_code, 503)
+    self.assertEqual(len(self.server.requests), 4)
+
+  def test_Request_RetriesIdempotentWrites(self):
+    self.server.failures = 1
+    resp = self.session.post(self.base_url + '/friendships/destroy.json',
+                             data={'screen_name': 'Twitter'})
+    self.assertEqual(resp.status_code, 200)
+    self.assertEqual(len(self.server.requests), 2)
+
+  def test_Request_DoesNotRetryListCreate(self):
+    self.server.failures = 1
+    resp = self.session.post(self.base_url + '/lists/create.json',
+                             data={'name': 'Social'})
+    self.assertEqual(resp.status_code, 503)
+    self.assertEqual(len(self.server.requests), 1)
+
+  def test_IsRetryable_OnlyAllowListedWrites(self):
+    self.assertTrue(tbc.RetryingSession.IsRetryable(
+        'GET', self.base_url + '/lists/create.json'))
+    self.assertTrue(tbc.RetryingSession.IsRetryable(
+        'POST', self.base_url + '/mutes/users/destroy.json'))
+    # Writes not known to be safe to repeat, e.g. ones added later.
+    self.assertFalse(tbc.RetryingSession.IsRetryable(
+        'POST', self.base_url + '/statuses/update.json'))
+
+  def test_Request_RetriesConnectionErrors(self):
+    self.server.shutdown()
+    self.server.server_close()
+    with self.assertRaises(requests.ConnectionError):
+      self.session.get(self.base_url + '/friends/ids.json')
+    self.assertEqual(len(self.sleeps), 3)
+
+  def _Api(self):
+    api = twitter.Api(consumer_key='a', consumer_secret='b',
+                      access_token_key='c', access_token_secret='d',
+                      base_url=self.base_url)
+    tbc.ConfigureApi(api, self.session.config)
+    api._session.sleep = self.sleeps.append
+    return api
+
+  def test_RetriedListDeleteFindingNoListSucceeds(self):
+    # The first attempt deleted the list but failed, the retry finds no list.
+    self.server.failures = 1
+    self.server.not_found.add('/1.1/lists/destroy.json')
+    api_account = tbc.TwitterAccount(
+        follows=[], meta_lists=[],
+        lists=[tbc.TwitterList(id=10, name='Old', members=[])])
+    config_account = tbc.TwitterAccount(follows=[], lists=[], meta_lists=[])
+    with patch('builtins.input', return_value='a'):
+      merged = tbc.AccountMerger(self._Api()).MergeAccounts(api_account,
+                                                            config_account)
+    self.assertEqual(list(merged.lists), [])
+    self.assertEqual(self.server.requests,
+                     [('POST', '/1.1/lists/destroy.json')] * 2)
+
+  def test_ConfigureApi(self):
+    self.server.failures = 1
+    api = self._Api()
+    next_cursor, _, ids = api.GetFriendIDsPaged()
+    self.assertEqual(ids, [1, 2, 3])
+    self.assertEqual(len(self.server.requests), 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -28,7 +28,9 @@ class TestTwitterAccount(unittest.TestCase):
                        lists=['Social Media', 'aSortTest'])
     account = tbc.TwitterAccount(follows=[user3, user4, user1],
                                  lists=[tl2, tl1],
-                                 meta_lists=[ml2, ml1])
+                                 meta_lists=[ml2, ml1],
+                                 blocks=[user2],
+                                 mutes=[user4, user3])
 
     expected_dict = {
       'follows': [
@@ -65,6 +67,11 @@ class TestTwitterAccount(unittest.TestCase):
               'lists': ['aSortTest', 'Social Media'],
           },
       ],
+      'blocks': [{'username': 'Twitter'}],
+      'mutes': [
+          {'username': 'zSortTest'},
+          {'username': 'ZzSortTest'},
+      ],
     }
     self.assertEqual(account.ToConfigDict(), expected_dict)
 
@@ -84,6 +91,7 @@ class TestTwitterAccount(unittest.TestCase):
           'is_private': True,
           'lists': ['Social Media'],
       }],
+      'blocks': [{'username': 'Facebook'}],
     }
     # NOTE: that these models don't include ids compared to the ToConfigDict
     # test. This is because ToConfigDict strips the #'s and FromConfigDict
@@ -98,7 +106,9 @@ class TestTwitterAccount(unittest.TestCase):
                       lists=['Social Media'])
     expected_account = tbc.TwitterAccount(follows=[user1],
                                           lists=[tl],
-                                          meta_lists=[ml])
+                                          meta_lists=[ml],
+                                          blocks=[user2],
+                                          mutes=None)
     account = tbc.TwitterAccount.FromConfigDict(config_dict)
     self.assertEqual(account, expected_account)
 
@@ -115,6 +125,9 @@ class TestTwitterAccount(unittest.TestCase):
     mock_api.GetLists = MagicMock(return_value=[list1, list2])
     mock_api.GetListMembers = MagicMock()
     mock_api.GetListMembers.side_effect = [[user1], [user1, user2]]
+    mock_api.GetBlocksIDsPaged = MagicMock(return_value=(0, 0, [2]))
+    mock_api.GetMutesIDsPaged = MagicMock(return_value=(0, 0, []))
+    mock_api.UsersLookup = MagicMock(return_value=[user2])
     account = tbc.TwitterAccount.FromApi(mock_api)
     # Verify correct mock calls.
     mock_api.GetFriends.assert_called_once()
@@ -136,6 +149,33 @@ class TestTwitterAccount(unittest.TestCase):
     self.assertEqual(account.meta_lists[0].name, 'META: All')
     self.assertEqual(account.meta_lists[0].is_private, True)
     self.assertEqual(account.meta_lists[0].twitter_list.id, 20)
+    mock_api.UsersLookup.assert_called_once_with(user_id=[2])
+    self.assertEqual(len(account.blocks), 1)
+    self.assertEqual(account.blocks[0].id, 2)
+    self.assertEqual(account.blocks[0].username, 'BarackObama')
+    self.assertEqual(account.mutes, [])
+
+  def test_FromApi_BlocksPagedByIds(self):
+    mock_api = twitter.Api()
+    mock_api.GetFriends = MagicMock(return_value=[])
+    mock_api.GetLists = MagicMock(return_value=[])
+    ids = list(range(250))
+    mock_api.GetBlocksIDsPaged = MagicMock()
+    mock_api.GetBlocksIDsPaged.side_effect = [(7, 0, ids[:150]),
+                                              (0, 7, ids[150:])]
+    mock_api.GetMutesIDsPaged = MagicMock(return_value=(0, 0, []))
+    mock_api.UsersLookup = MagicMock()
+    mock_api.UsersLookup.side_effect = lambda user_id: [
+        twitter.User.NewFromJsonDict(
+            {'id': i, 'screen_name': 'user{0}'.format(i)}) for i in user_id]
+    account = tbc.TwitterAccount.FromApi(mock_api)
+    mock_api.GetBlocksIDsPaged.assert_has_calls([call(cursor=-1),
+                                                 call(cursor=7)])
+    # Usernames are hydrated in batches of at most 100 IDs.
+    mock_api.UsersLookup.assert_has_calls([call(user_id=ids[:100]),
+                                           call(user_id=ids[100:200]),
+                                           call(user_id=ids[200:])])
+    self.assertEqual([user.id for user in account.blocks], ids)
 
   def test_ReadFromConfig(self):
     account = tbc.TwitterAccount.ReadFromConfig('testdata/simple_account.yaml')
@@ -156,6 +196,10 @@ class TestTwitterAccount(unittest.TestCase):
     self.assertEqual(len(account.meta_lists[0].lists), 2)
     self.assertCountEqual(account.meta_lists[0].lists,
                           ['Starcraft', 'Philosophy'])
+    self.assertEqual(len(account.blocks), 1)
+    self.assertEqual(account.blocks[0].username, 'spambot')
+    # No mutes section means mutes are not managed by the config.
+    self.assertIsNone(account.mutes)
 
 
 if __name__ == '__main__':
@@ -1,3 +1,5 @@
+import importlib
+
 from .models import (
   TwitterUser,
   TwitterList,
@@ -5,8 +7,53 @@ from .models import (
   TwitterAccount,
 )
 
-from .accountmerger import (
-  AccountMerger,
+from .configloader import (
+  ConfigCache,
+  ConfigLoader,
+)
+
+from .streaming import (
+  ExternalSorter,
+  StreamAccountToConfig,
+)
+
+from .validator import (
+  ConfigValidator,
+)
+
+from .history import (
+  HistoryStore,
 )
 
+from .metaliststate import (
+  MetaListState,
+)
+
+from .pipeline import (
+  SyncPipeline,
+)
+
+# Modules depending on python-twitter are only imported on first use
+# so that offline commands like validate start quickly.
+_LAZY_EXPORTS = {
+  'AccountMerger': '.accountmerger',
+  'Mutation': '.mutationqueue',
+  'MutationQueue': '.mutationqueue',
+  'QueueDrainer': '.mutationqueue',
+  'SyncEstimate': '.estimator',
+  'SyncEstimator': '.estimator',
+  'ConfigureApi': '.transport',
+  'RetryingSession': '.transport',
+  'TransportConfig': '.transport',
+}
+
+
+def __getattr__(name):
+  if name in _LAZY_EXPORTS:
+    return getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__),
+                   name)
+  raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__,
+                                                                    name))
+
+
 __version__ = '0.0.1'
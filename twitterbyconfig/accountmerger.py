@@ -1,6 +1,13 @@
+import dataclasses
 import enum
+import operator
 import twitter
 
+from twitterbyconfig.mutationqueue import (
+    Mutation,
+    IsQuotaError,
+)
+
 from twitterbyconfig.models import (
     TwitterUser,
     TwitterList,
@@ -8,6 +15,10 @@ from twitterbyconfig.models import (
     TwitterAccount,
 )
 
+from twitterbyconfig.pipeline import (
+    Resolve,
+)
+
 
 class DiffAction(enum.Enum):
   UNKNOWN = 0
@@ -16,58 +27,176 @@ class DiffAction(enum.Enum):
   CONFIRM_EACH = 3
 
 
+_USERNAME = operator.attrgetter('username')
+# Twitter error code for a missing resource, e.g. a list already deleted.
+NOT_FOUND_ERROR_CODE = 34
+
+
+def _Usernames(users):
+  # map() with attrgetter avoids a Python level loop over large collections.
+  return set(map(_USERNAME, users))
+
+
+def _IsNotFoundError(error):
+  messages = error.message if isinstance(error.message, list) else [
+      error.message]
+  return any(isinstance(m, dict) and m.get('code') == NOT_FOUND_ERROR_CODE
+             for m in messages)
+
+
+@dataclasses.dataclass
+class ListDelta:
+  '''Members added to and removed from a list during a merge.'''
+  added: set = dataclasses.field(default_factory=set) # set[str]
+  removed: set = dataclasses.field(default_factory=set) # set[str]
+  # Usernames of the canonical members after the merge.
+  members: set = dataclasses.field(default_factory=set) # set[str]
+
+  def HadMember(self, username):
+    return username in self.removed or (username in self.members and
+                                        username not in self.added)
+
+  def HasMember(self, username):
+    return username in self.members
+
+
 class AccountMerger:
-  def __init__(self, api):
+  def __init__(self, api, rebuild_meta_lists=False, mutation_queue=None,
+               meta_list_state=None):
     self.api = api
+    # When set, meta-lists are fully re-hydrated and diffed instead of
+    # receiving the deltas of their base lists.
+    self.rebuild_meta_lists = rebuild_meta_lists
+    # When set, capped mutations over the daily quota are queued for later.
+    self.mutation_queue = mutation_queue
+    # When set, meta-lists whose lists changed since they were last synced
+    # are rebuilt. Otherwise such edits cannot be detected.
+    self.meta_list_state = meta_list_state
+    self.list_deltas = {} # dict[str, ListDelta]
 
   def MergeAccounts(self, api_account, config_account):
-    canonical_follows = self._MergeFollows(api_account.follows,
+    '''Updates Twitter to match the config, returns the canonical account.
+
+    Either account, and each part of api_account, may be a Future from a
+    SyncPipeline. Parts are only waited for when they are merged.
+    '''
+    self.list_deltas = {}
+    config_account = Resolve(config_account)
+    canonical_follows = self._MergeFollows(Resolve(api_account.follows),
                                            config_account.follows)
-    canonical_lists = self._MergeLists(api_account.lists,
+    canonical_lists = self._MergeLists(Resolve(api_account.lists),
                                        config_account.lists)
-    self._MergeMetaLists(api_account.meta_lists,
+    self._MergeMetaLists(Resolve(api_account.meta_lists),
                          config_account.meta_lists,
                          canonical_lists)
+    # Blocks and mutes are only merged when the config has their section,
+    # otherwise they are left as they are on Twitter.
+    canonical_blocks = None
+    if config_account.blocks is not None:
+      canonical_blocks = self._MergeBlocks(Resolve(api_account.blocks),
+                                           config_account.blocks)
+    canonical_mutes = None
+    if config_account.mutes is not None:
+      canonical_mutes = self._MergeMutes(Resolve(api_account.mutes),
+                                         config_account.mutes)
+    if self.mutation_queue:
+      self.mutation_queue.Save()
+    if self.meta_list_state:
+      self.meta_list_state.Save()
     return TwitterAccount(follows=canonical_follows,
                           lists=canonical_lists,
-                          meta_lists=config_account.meta_lists)
+                          meta_lists=config_account.meta_lists,
+                          blocks=canonical_blocks,
+                          mutes=canonical_mutes)
 
   def _MergeFollows(self, api_follows, config_follows):
-    # Step 1: Compute follow sets.
-    api_set = {follow.username for follow in api_follows}
-    config_set = {follow.username for follow in config_follows}
-    canonical_follows = {follow.username:follow for follow in api_follows}
-    # Step 2: Add missing follows.
-    follows_to_add = config_set.difference(api_set)
-    self._PromptThenMaybeExecute(
-        items=follows_to_add,
-        summary='Merging follows will result in {0} follows added'.format(
-            len(follows_to_add)),
-        per_item_desc=lambda item: '    Follow: @{0}'.format(item),
-        per_item_executor=lambda item: self._AddFollow(item, canonical_follows))
-    # Step 3: Removing unnecessary follows.
-    follows_to_remove = api_set.difference(config_set)
-    self._PromptThenMaybeExecute(
-        items=follows_to_remove,
-        summary='Merging follows will result in {0} follows removed'.format(
-            len(follows_to_remove)),
-        per_item_desc=lambda item: '    Unfollow: @{0}'.format(item),
-        per_item_executor=lambda item: self._Unfollow(item, canonical_follows))
-    return canonical_follows.values()
+    return self._MergeUsers(api_follows,
+                            config_follows,
+                            collection='follows',
+                            add_verb='Follow',
+                            remove_verb='Unfollow',
+                            add_executor=self._AddFollow,
+                            remove_executor=self._Unfollow)
 
   def _AddFollow(self, follow, canonical_follows):
-    try:
-      pt_user = self.api.CreateFriendship(screen_name=follow)
-      user = TwitterUser.FromPythonTwitter(pt_user)
-      canonical_follows[user.name] = user
-
-    except twitter.TwitterError as e:
-      print('   Error adding @{0}: {1}'.format(follow, e))
+    self._AddUser(self.api.CreateFriendship, follow, canonical_follows,
+                  mutation=Mutation(action='follow', username=follow))
 
   def _Unfollow(self, follow, canonical_follows):
     self.api.DestroyFriendship(screen_name=follow)
     del canonical_follows[follow]
 
+  def _MergeBlocks(self, api_blocks, config_blocks):
+    return self._MergeUsers(api_blocks,
+                            config_blocks,
+                            collection='blocks',
+                            add_verb='Block',
+                            remove_verb='Unblock',
+                            add_executor=self._AddBlock,
+                            remove_executor=self._Unblock)
+
+  def _AddBlock(self, block, canonical_blocks):
+    self._AddUser(self.api.CreateBlock, block, canonical_blocks)
+
+  def _Unblock(self, block, canonical_blocks):
+    self.api.DestroyBlock(screen_name=block)
+    del canonical_blocks[block]
+
+  def _MergeMutes(self, api_mutes, config_mutes):
+    return self._MergeUsers(api_mutes,
+                            config_mutes,
+                            collection='mutes',
+                            add_verb='Mute',
+                            remove_verb='Unmute',
+                            add_executor=self._AddMute,
+                            remove_executor=self._Unmute)
+
+  def _AddMute(self, mute, canonical_mutes):
+    self._AddUser(self.api.CreateMute, mute, canonical_mutes)
+
+  def _Unmute(self, mute, canonical_mutes):
+    self.api.DestroyMute(screen_name=mute)
+    del canonical_mutes[mute]
+
+  def _MergeUsers(self, api_users, config_users, collection, add_verb,
+                  remove_verb, add_executor, remove_executor):
+    # Step 1: Compute user sets.
+    api_set = _Usernames(api_users)
+    config_set = _Usernames(config_users)
+    # Changes are sorted so they are proposed in a stable order.
+    users_to_add = sorted(config_set.difference(api_set))
+    users_to_remove = sorted(api_set.difference(config_set))
+    if not users_to_add and not users_to_remove:
+      return api_users
+    canonical_users = {user.username:user for user in api_users}
+    # Step 2: Add missing users.
+    self._PromptThenMaybeExecute(
+        items=users_to_add,
+        summary='Merging {0} will result in {1} {0} added'.format(
+            collection, len(users_to_add)),
+        per_item_desc=lambda item: '    {0}: @{1}'.format(add_verb, item),
+        per_item_executor=lambda item: add_executor(item, canonical_users))
+    # Step 3: Remove unnecessary users.
+    self._PromptThenMaybeExecute(
+        items=users_to_remove,
+        summary='Merging {0} will result in {1} {0} removed'.format(
+            collection, len(users_to_remove)),
+        per_item_desc=lambda item: '    {0}: @{1}'.format(remove_verb, item),
+        per_item_executor=lambda item: remove_executor(item, canonical_users))
+    return canonical_users.values()
+
+  def _AddUser(self, create_fn, username, canonical_users, mutation=None):
+    if self._QueueIfOverQuota(mutation, canonical_users):
+      return
+    try:
+      pt_user = create_fn(screen_name=username)
+      user = TwitterUser.FromPythonTwitter(pt_user)
+      canonical_users[user.username] = user
+      self._RecordApplied(mutation)
+    except twitter.TwitterError as e:
+      if not self._QueueIfQuotaError(e, mutation, canonical_users):
+        print('   Error adding @{0}: {1}'.format(username, e))
+
   def _MergeLists(self, api_lists, config_lists):
     # Step 1: Compute list sets.
     api_set = {l.name for l in api_lists}
@@ -95,8 +224,10 @@ class AccountMerger:
                                                         canonical_lists))
     # Step 4: Update list privacy.
     # TODO: list.is_private merge
-    # Step 5: Update members for each canonical list.
+    # Step 5: Update members for each canonical list, in turn waiting for
+    # its members to be downloaded.
     for canonical_list in canonical_lists.values():
+      canonical_list.members = Resolve(canonical_list.members)
       config_list = next((l for l in config_lists
                           if l.name == canonical_list.name),
                          None)
@@ -113,64 +244,233 @@ class AccountMerger:
   def _AddList(self, list_name, config_lists, canonical_lists):
     config_list = next(l for l in config_lists if l.name == list_name)
     mode = 'private' if config_list.is_private else 'public'
-    new_list = self.api.CreateList(config_list.name, mode=mode)
+    new_list = TwitterList.FromPythonTwitter(
+        self.api.CreateList(config_list.name, mode=mode), [])
     canonical_lists[new_list.name] = new_list
-    return TwitterList.FromPythonTwitter(new_list, [])
+    return new_list
 
   def _DeleteList(self, list_name, api_lists, canonical_lists):
     api_list = next(l for l in api_lists if l.name == list_name)
-    self.api.DestroyList(list_id=api_list.id)
+    try:
+      self.api.DestroyList(list_id=api_list.id)
+    except twitter.TwitterError as e:
+      # A retried delete finds the list already deleted by the attempt
+      # which timed out.
+      if not _IsNotFoundError(e):
+        raise
     del canonical_lists[api_list.name]
     return api_list
 
   def _MergeList(self, api_list, config_list):
     # Step 1: Compute member sets.
-    api_members = {user.username for user in api_list.members}
-    config_members = {user.username for user in config_list.members}
+    api_members = _Usernames(api_list.members)
+    config_members = _Usernames(config_list.members)
+    members_to_add = sorted(config_members.difference(api_members))
+    members_to_remove = sorted(api_members.difference(config_members))
+    if not members_to_add and not members_to_remove:
+      self.list_deltas[config_list.name] = ListDelta(members=api_members)
+      return api_list.members
     canonical_members = {user.username:user for user in api_list.members}
-    # Step 2: Add missing members.
-    members_to_add = config_members.difference(api_members)
+    # Step 2: Add and remove members.
+    self._ApplyListDiff(api_list, config_list.name, members_to_add,
+                        members_to_remove, canonical_members)
+    # Step 3: Record what changed for meta-lists built from this list.
+    added = {m for m in members_to_add if m in canonical_members}
+    removed = {m for m in members_to_remove if m not in canonical_members}
+    self.list_deltas[config_list.name] = ListDelta(
+        added=added,
+        removed=removed,
+        members=set(canonical_members))
+    return canonical_members.values()
+
+  def _ApplyListDiff(self, api_list, list_name, members_to_add,
+                     members_to_remove, canonical_members):
     self._PromptThenMaybeExecute(
         items=members_to_add,
         summary='Merging list "{0}" will result in {1} members added'.format(
-            config_list.name, len(members_to_add)),
+            list_name, len(members_to_add)),
         per_item_desc=lambda item: '    Add @{0} to list "{1}"'.format(
-            item, config_list.name),
+            item, list_name),
         per_item_executor=lambda item: self._AddListMember(api_list,
                                                            item,
                                                            canonical_members))
-    # Step 3: Remove unnecessary members.
-    members_to_remove = api_members.difference(config_members)
     self._PromptThenMaybeExecute(
         items=members_to_remove,
         summary='Merging list "{0}" will result in {1} members removed'.format(
-            config_list.name, len(members_to_remove)),
+            list_name, len(members_to_remove)),
         per_item_desc=lambda item: '    Remove @{0} from list "{1}"'.format(
-            item, config_list.name),
+            item, list_name),
         per_item_executor=lambda item: self._RemoveListMember(api_list,
                                                               item,
                                                               canonical_members))
-    return canonical_members.values()
 
   def _AddListMember(self, api_list, member, canonical_members):
+    mutation = Mutation(action='add_list_member', username=member,
+                        list_id=api_list.id, list_name=api_list.name)
+    if self._QueueIfOverQuota(mutation, canonical_members):
+      return
     try:
       self.api.CreateListsMember(list_id=api_list.id, screen_name=member)
       canonical_members[member] = TwitterUser(username=member)
+      self._RecordApplied(mutation)
     except twitter.TwitterError as e:
-      print('   Error add list member @{0}: {1}'.format(member, e))
+      if not self._QueueIfQuotaError(e, mutation, canonical_members):
+        print('   Error add list member @{0}: {1}'.format(member, e))
 
   def _RemoveListMember(self, api_list, member, canonical_members):
     self.api.DestroyListsMember(list_id=api_list.id, screen_name=member)
     del canonical_members[member]
 
   def _MergeMetaLists(self, api_ml, config_ml, canonical_lists):
-    # Step 1: Hydrate each MetaList into a corresponding TwitterList.
-    api_lists = [meta_list.ToTwitterList(canonical_lists)
-                 for meta_list in api_ml]
-    config_lists = [meta_list.ToTwitterList(canonical_lists)
-                    for meta_list in config_ml]
-    # Step 2: Perform equivalent list merging as done with non-meta lists.
-    self._MergeLists(api_lists, config_lists)
+    # Step 1: Create and delete meta-lists. Only newly created meta-lists are
+    # hydrated from their base lists.
+    api_names = {ml.name for ml in api_ml}
+    config_names = {ml.name for ml in config_ml}
+    new_meta_lists = [ml.ToTwitterList(canonical_lists)
+                      for ml in config_ml if ml.name not in api_names]
+    self._MergeLists([ml.ToTwitterList(canonical_lists)
+                      for ml in api_ml if ml.name not in config_names],
+                     new_meta_lists)
+    for name in api_names - config_names:
+      self._ForgetMetaList(name)
+    for meta_list, new_list in zip(
+        [ml for ml in config_ml if ml.name not in api_names], new_meta_lists):
+      delta = self.list_deltas.get(meta_list.name)
+      self._RecordMetaList(meta_list, delta is not None and all(
+          member.username in delta.members for member in new_list.members))
+    # Step 2: Update members of pre-existing meta-lists.
+    api_meta_lists = {ml.name:ml.twitter_list for ml in api_ml}
+    for meta_list in config_ml:
+      if meta_list.name not in api_meta_lists:
+        continue
+      if self._NeedsRebuild(meta_list):
+        synced = self._RebuildMetaList(api_meta_lists[meta_list.name],
+                                       meta_list,
+                                       canonical_lists)
+      else:
+        synced = self._PropagateListDeltas(api_meta_lists[meta_list.name],
+                                           meta_list,
+                                           canonical_lists)
+      self._RecordMetaList(meta_list, synced)
+
+  def _NeedsRebuild(self, meta_list):
+    if self.rebuild_meta_lists:
+      return True
+    if self.meta_list_state is None:
+      print('   Warning: cannot tell if the lists of meta-list "{0}" changed,'
+            ' use --rebuild-meta-lists if they did'.format(meta_list.name))
+      return False
+    if not self.meta_list_state.Matches(meta_list):
+      print('Lists of meta-list "{0}" changed since the last sync,'
+            ' rebuilding it'.format(meta_list.name))
+      return True
+    return False
+
+  def _RecordMetaList(self, meta_list, synced):
+    '''Records the composition of a meta-list whose sync was accepted.
+
+    A meta-list left partly unsynced is forgotten so that the next sync
+    rebuilds it rather than only applying that sync's changes.
+    '''
+    if self.meta_list_state is None:
+      return
+    if synced:
+      self.meta_list_state.Put(meta_list)
+    else:
+      self.meta_list_state.Remove(meta_list.name)
+
+  def _ForgetMetaList(self, name):
+    if self.meta_list_state is not None:
+      self.meta_list_state.Remove(name)
+
+  def _RebuildMetaList(self, api_list, meta_list, canonical_lists):
+    '''Diffs a meta-list against the union of its base lists' members.
+
+    The union is computed over the member sets already built for the base
+    lists. Returns whether the whole diff was applied.
+    '''
+    config_members = set().union(*(
+        self._GetListDelta(name, canonical_lists).members
+        for name in meta_list.lists))
+    api_members = _Usernames(Resolve(api_list.members))
+    members_to_add = config_members.difference(api_members)
+    members_to_remove = api_members.difference(config_members)
+    return self._ApplyMetaListDiff(api_list, meta_list, members_to_add,
+                                   members_to_remove)
+
+  def _PropagateListDeltas(self, api_list, meta_list, canonical_lists):
+    '''Applies the member changes of a meta-list's base lists to it.
+
+    A user is added when now present in some base list but previously in
+    none, and removed when previously present but now in none. This costs
+    O(changes) and assumes the meta-list was in sync before this merge with
+    the same lists, see _NeedsRebuild. Returns whether the whole diff was
+    applied.
+    '''
+    deltas = [self._GetListDelta(name, canonical_lists)
+              for name in meta_list.lists]
+    candidates = set()
+    for delta in deltas:
+      candidates.update(delta.added, delta.removed)
+    members_to_add = set()
+    members_to_remove = set()
+    for member in candidates:
+      had_member = any(delta.HadMember(member) for delta in deltas)
+      has_member = any(delta.HasMember(member) for delta in deltas)
+      if has_member and not had_member:
+        members_to_add.add(member)
+      elif had_member and not has_member:
+        members_to_remove.add(member)
+    return self._ApplyMetaListDiff(api_list, meta_list, members_to_add,
+                                   members_to_remove)
+
+  def _ApplyMetaListDiff(self, api_list, meta_list, members_to_add,
+                         members_to_remove):
+    '''Applies a meta-list diff, returns whether all of it was applied.'''
+    # Only users being removed need to be tracked as existing members.
+    canonical_members = {member:TwitterUser(username=member)
+                         for member in members_to_remove}
+    self._ApplyListDiff(api_list, meta_list.name, members_to_add,
+                        members_to_remove, canonical_members)
+    return (all(member in canonical_members for member in members_to_add) and
+            not any(member in canonical_members
+                    for member in members_to_remove))
+
+  def _GetListDelta(self, list_name, canonical_lists):
+    if list_name not in self.list_deltas:
+      # The list was not merged so its membership is unchanged.
+      canonical_list = next((l for l in canonical_lists
+                             if l.name == list_name), None)
+      members = canonical_list.members if canonical_list else []
+      self.list_deltas[list_name] = ListDelta(members=_Usernames(members))
+    return self.list_deltas[list_name]
+
+  def _QueueIfOverQuota(self, mutation, canonical_members):
+    if (mutation and self.mutation_queue and
+        not self.mutation_queue.HasQuota(mutation.action)):
+      self._Enqueue(mutation, canonical_members)
+      return True
+    return False
+
+  def _QueueIfQuotaError(self, error, mutation, canonical_members):
+    if mutation and self.mutation_queue and IsQuotaError(error):
+      self.mutation_queue.RecordQuotaError(mutation.action)
+      self._Enqueue(mutation, canonical_members)
+      return True
+    return False
+
+  def _RecordApplied(self, mutation):
+    if mutation and self.mutation_queue:
+      self.mutation_queue.RecordApplied(mutation.action)
+      # A mutation queued by an earlier sync is done once applied directly.
+      self.mutation_queue.Remove(mutation)
+
+  def _Enqueue(self, mutation, canonical_members):
+    self.mutation_queue.Enqueue(mutation)
+    # Queued users stay canonical so that writing back the config keeps them.
+    canonical_members[mutation.username] = TwitterUser(
+        username=mutation.username)
+    print('   Queued {0}, daily limit reached'.format(mutation.Describe()))
 
   def _DiffPrompt(self):
     prompt = input(
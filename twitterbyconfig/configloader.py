@@ -0,0 +1,196 @@
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import yaml
+
+
+INCLUDE_KEY = 'include'
+# Config sections which are concatenated across included files.
+SECTION_KEYS = ('follows', 'lists', 'meta_lists', 'blocks', 'mutes')
+# Sections which are left out of the loaded config unless some file has them,
+# so that a missing section can be told apart from an empty one.
+OPTIONAL_SECTION_KEYS = ('blocks', 'mutes')
+# Starting a process pool costs around half a second, more than parsing a
+# typical split config serially, so a pool is only used for at least this
+# much uncached YAML.
+PARALLEL_PARSE_MIN_BYTES = 4 * 1024 * 1024
+# Configs are loaded from SyncPipeline's worker threads, and forking a
+# multi-threaded process can deadlock the child on locks held by other
+# threads, so workers are started fresh instead.
+_POOL_CONTEXT = multiprocessing.get_context('spawn')
+# The libyaml backed loader is much faster when PyYAML was built with it.
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def _ParseYaml(content):
+  return yaml.load(content, Loader=_YAML_LOADER) or {}
+
+
+class ConfigCache:
+  '''Cache of parsed config files keyed on path, mtime and content hash.
+
+  A file whose mtime and size are unchanged is served without being read.
+  Otherwise its content is hashed so a touched but unchanged file is still
+  not re-parsed. When a path is given the cache is persisted as JSON so it
+  survives between syncs.
+  '''
+  def __init__(self, path=None):
+    self.path = path
+    self.entries = {} # dict[str, dict]
+    self.dirty = False
+    if path and os.path.exists(path):
+      try:
+        with open(path, 'r') as stream:
+          self.entries = json.load(stream)
+      except (OSError, ValueError) as e:
+        print('Ignoring unreadable config cache {0}: {1}'.format(path, e))
+
+  def Get(self, config_file, stat, digest=None):
+    '''Returns cached data for the file or None if it must be re-parsed.'''
+    entry = self.entries.get(config_file)
+    if not entry:
+      return None
+    if entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+      return entry['data']
+    if digest and entry['sha256'] == digest:
+      self.Put(config_file, stat, digest, entry['data'])
+      return entry['data']
+    return None
+
+  def Put(self, config_file, stat, digest, data):
+    self.entries[config_file] = {
+      'mtime_ns': stat.st_mtime_ns,
+      'size': stat.st_size,
+      'sha256': digest,
+      'data': data,
+    }
+    self.dirty = True
+
+  def Save(self):
+    if not self.path or not self.dirty:
+      return
+    cache_dir = os.path.dirname(os.path.abspath(self.path))
+    stream = None
+    try:
+      # Written aside and swapped in so a crash or a concurrent sync never
+      # sees a partial cache.
+      with tempfile.NamedTemporaryFile('w', dir=cache_dir,
+                                       delete=False) as stream:
+        json.dump(self.entries, stream)
+      os.replace(stream.name, self.path)
+      self.dirty = False
+    except (OSError, TypeError, ValueError) as e:
+      if stream is not None and os.path.exists(stream.name):
+        os.remove(stream.name)
+      print('Unable to write config cache {0}: {1}'.format(self.path, e))
+
+
+class ConfigLoader:
+  '''Loads a config file along with the files it includes.
+
+  A config may list other config files under "include", relative to its own
+  location. The sections of every file are concatenated in include order.
+  Files which are not in the cache are parsed one level of includes at a
+  time, in parallel when there is enough of them to repay starting a pool.
+  '''
+  def __init__(self, cache=None, max_workers=None):
+    self.cache = cache if cache is not None else ConfigCache()
+    self.max_workers = max_workers
+
+  def Load(self, config_file):
+    root = os.path.abspath(config_file)
+    parsed = {}
+    pending = [root]
+    while pending:
+      for path, data in zip(pending, self._ParseAll(pending)):
+        parsed[path] = data
+      pending = list(dict.fromkeys(
+          include for path in pending for include in self._Includes(path,
+                                                                    parsed)
+          if include not in parsed))
+    self.cache.Save()
+    merged = {key: [] for key in SECTION_KEYS
+              if key not in OPTIONAL_SECTION_KEYS}
+    self._MergeInto(merged, root, parsed, [], set())
+    return merged
+
+  def _ParseAll(self, paths):
+    results = {}
+    to_parse = {}
+    for path in paths:
+      stat = os.stat(path)
+      data = self.cache.Get(path, stat)
+      if data is None:
+        with open(path, 'rb') as stream:
+          content = stream.read()
+        digest = hashlib.sha256(content).hexdigest()
+        data = self.cache.Get(path, stat, digest)
+        if data is None:
+          to_parse[path] = (stat, digest, content)
+          continue
+      results[path] = data
+    if self._ParseInParallel(to_parse):
+      with concurrent.futures.ProcessPoolExecutor(
+          max_workers=self.max_workers, mp_context=_POOL_CONTEXT) as executor:
+        futures = {path: executor.submit(_ParseYaml, content)
+                   for path, (_, _, content) in to_parse.items()}
+        for path, future in futures.items():
+          results[path] = self._ParseResult(path, future.result)
+    else:
+      for path, (_, _, content) in to_parse.items():
+        results[path] = self._ParseResult(path, lambda: _ParseYaml(content))
+    for path, (stat, digest, _) in to_parse.items():
+      self.cache.Put(path, stat, digest, results[path])
+    return [results[path] for path in paths]
+
+  def _ParseInParallel(self, to_parse):
+    if len(to_parse) < 2 or (os.cpu_count() or 1) < 2:
+      return False
+    return sum(len(content) for _, _, content in to_parse.values()) >= (
+        PARALLEL_PARSE_MIN_BYTES)
+
+  def Includes(self, config_file):
+    '''Returns the files a config directly includes, if it exists.'''
+    root = os.path.abspath(config_file)
+    if not os.path.exists(root):
+      return []
+    parsed = {root: self._ParseAll([root])[0]}
+    self.cache.Save()
+    return self._Includes(root, parsed)
+
+  def _ParseResult(self, path, parse):
+    try:
+      data = parse()
+    except yaml.YAMLError as e:
+      raise yaml.YAMLError('{0}: {1}'.format(path, e))
+    if not isinstance(data, dict):
+      raise ValueError('{0}: config must be a mapping of sections, got:'
+                       ' {1}'.format(path, type(data).__name__))
+    for key in SECTION_KEYS + (INCLUDE_KEY,):
+      if data.get(key) is not None and not isinstance(data[key], list):
+        raise ValueError('{0}: {1} must be a list, got: {2}'.format(
+            path, key, data[key]))
+    return data
+
+  def _Includes(self, path, parsed):
+    base_dir = os.path.dirname(path)
+    return [os.path.abspath(os.path.join(base_dir, include))
+            for include in parsed[path].get(INCLUDE_KEY, None) or []]
+
+  def _MergeInto(self, merged, path, parsed, stack, seen):
+    if path in stack:
+      raise ValueError('Config include cycle: {0}'.format(
+          ' -> '.join(stack + [path])))
+    if path in seen:
+      # Files included more than once are only merged the first time.
+      return
+    seen.add(path)
+    data = parsed[path]
+    for key in SECTION_KEYS:
+      if key in data:
+        merged.setdefault(key, []).extend(data[key] or [])
+    for include in self._Includes(path, parsed):
+      self._MergeInto(merged, include, parsed, stack + [path], seen)
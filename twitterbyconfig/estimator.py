@@ -0,0 +1,297 @@
+import dataclasses
+import math
+import time
+import twitter
+
+from twitterbyconfig.models import (
+    FRIENDS_PAGE_SIZE,
+    IDS_PAGE_SIZE,
+    SYNC_LIST_MEMBERS_PAGE_SIZE,
+    USERS_LOOKUP_BATCH_SIZE,
+    TwitterUser,
+    TwitterList,
+)
+
+from twitterbyconfig.accountmerger import (
+    AccountMerger,
+)
+
+from twitterbyconfig.mutationqueue import (
+    DAILY_CAPS,
+)
+
+
+DAY_SECS = 24 * 60 * 60
+WINDOW_SECS = 15 * 60
+
+
+@dataclasses.dataclass
+class Endpoint:
+  '''Class describing the cost model of a single Twitter API endpoint.'''
+  name: str = None
+  # Path used to look up the current quota, None if Twitter does not report
+  # a rate limit for the endpoint.
+  url: str = None
+  # Number of items handled by a single call.
+  batch_size: int = 1
+  # Calls allowed per window, None if the endpoint has no known limit.
+  window_calls: int = None
+  window_secs: int = WINDOW_SECS
+
+
+READ_ACTIONS = ('get_friends', 'get_lists', 'get_list_members',
+                'get_block_ids', 'get_mute_ids', 'users_lookup')
+
+
+ENDPOINTS = {
+  'get_friends': Endpoint(name='GET friends/list',
+                          url='/friends/list.json',
+                          batch_size=FRIENDS_PAGE_SIZE,
+                          window_calls=15),
+  'get_lists': Endpoint(name='GET lists/list',
+                        url='/lists/list.json',
+                        batch_size=100,
+                        window_calls=15),
+  'get_list_members': Endpoint(name='GET lists/members',
+                               url='/lists/members.json',
+                               batch_size=SYNC_LIST_MEMBERS_PAGE_SIZE,
+                               window_calls=900),
+  'get_block_ids': Endpoint(name='GET blocks/ids',
+                            url='/blocks/ids.json',
+                            batch_size=IDS_PAGE_SIZE,
+                            window_calls=15),
+  'get_mute_ids': Endpoint(name='GET mutes/users/ids',
+                           url='/mutes/users/ids.json',
+                           batch_size=IDS_PAGE_SIZE,
+                           window_calls=15),
+  'users_lookup': Endpoint(name='GET users/lookup',
+                           url='/users/lookup.json',
+                           batch_size=USERS_LOOKUP_BATCH_SIZE,
+                           window_calls=900),
+  'follow': Endpoint(name='POST friendships/create',
+                     window_calls=DAILY_CAPS['follow'],
+                     window_secs=DAY_SECS),
+  'unfollow': Endpoint(name='POST friendships/destroy'),
+  'create_list': Endpoint(name='POST lists/create'),
+  'delete_list': Endpoint(name='POST lists/destroy'),
+  'add_list_member': Endpoint(name='POST lists/members/create',
+                              window_calls=DAILY_CAPS['add_list_member'],
+                              window_secs=DAY_SECS),
+  'remove_list_member': Endpoint(name='POST lists/members/destroy'),
+  'block': Endpoint(name='POST blocks/create'),
+  'unblock': Endpoint(name='POST blocks/destroy'),
+  'mute': Endpoint(name='POST mutes/users/create'),
+  'unmute': Endpoint(name='POST mutes/users/destroy'),
+}
+
+
+@dataclasses.dataclass
+class EndpointEstimate:
+  '''Predicted cost of all planned calls against a single endpoint.'''
+  endpoint: Endpoint = None
+  items: int = 0
+  calls: int = 0
+  min_secs: float = 0
+
+
+@dataclasses.dataclass
+class SyncEstimate:
+  '''Predicted cost of a sync, one entry per endpoint used.'''
+  endpoints: list = None # list[EndpointEstimate]
+
+  def TotalCalls(self):
+    return sum(e.calls for e in self.endpoints)
+
+  def MinSecs(self):
+    '''Lower bound on wall time, bounded by the most constrained endpoint.'''
+    return max((e.min_secs for e in self.endpoints), default=0)
+
+  def Summary(self):
+    lines = ['{0:<30} {1:>8} {2:>8} {3:>12}'.format(
+        'Endpoint', 'Items', 'Calls', 'Min time')]
+    for e in self.endpoints:
+      lines.append('{0:<30} {1:>8} {2:>8} {3:>12}'.format(
+          e.endpoint.name, e.items, e.calls, _FormatSecs(e.min_secs)))
+    lines.append('Total: {0} calls, minimum completion time {1}'.format(
+        self.TotalCalls(), _FormatSecs(self.MinSecs())))
+    return lines
+
+
+class _PlanningMerger(AccountMerger):
+  '''AccountMerger which records planned actions instead of performing them.
+
+  Every diff is accepted without prompting so the plan covers the full sync,
+  including members of lists which would be created along the way.
+  '''
+  def __init__(self, meta_list_state=None):
+    super().__init__(api=None, meta_list_state=meta_list_state)
+    self.planned = {action: 0 for action in ENDPOINTS
+                    if action not in READ_ACTIONS}
+
+  def _PromptThenMaybeExecute(self,
+                              items=[],
+                              summary='',
+                              per_item_desc=lambda item: item,
+                              per_item_executor=lambda item: None):
+    return [per_item_executor(item) for item in items]
+
+  def _AddFollow(self, follow, canonical_follows):
+    self.planned['follow'] += 1
+    canonical_follows[follow] = TwitterUser(username=follow)
+
+  def _Unfollow(self, follow, canonical_follows):
+    self.planned['unfollow'] += 1
+    del canonical_follows[follow]
+
+  def _AddBlock(self, block, canonical_blocks):
+    self.planned['block'] += 1
+    canonical_blocks[block] = TwitterUser(username=block)
+
+  def _Unblock(self, block, canonical_blocks):
+    self.planned['unblock'] += 1
+    del canonical_blocks[block]
+
+  def _AddMute(self, mute, canonical_mutes):
+    self.planned['mute'] += 1
+    canonical_mutes[mute] = TwitterUser(username=mute)
+
+  def _Unmute(self, mute, canonical_mutes):
+    self.planned['unmute'] += 1
+    del canonical_mutes[mute]
+
+  def _AddList(self, list_name, config_lists, canonical_lists):
+    self.planned['create_list'] += 1
+    config_list = next(l for l in config_lists if l.name == list_name)
+    new_list = TwitterList(name=config_list.name,
+                           is_private=config_list.is_private,
+                           members=[])
+    canonical_lists[new_list.name] = new_list
+    return new_list
+
+  def _DeleteList(self, list_name, api_lists, canonical_lists):
+    self.planned['delete_list'] += 1
+    del canonical_lists[list_name]
+
+  def _AddListMember(self, api_list, member, canonical_members):
+    self.planned['add_list_member'] += 1
+    canonical_members[member] = TwitterUser(username=member)
+
+  def _RemoveListMember(self, api_list, member, canonical_members):
+    self.planned['remove_list_member'] += 1
+    del canonical_members[member]
+
+
+class SyncEstimator:
+  '''Predicts the API calls and wall time needed to sync an account.
+
+  The AccountMerger diff is run against copies of the accounts without
+  calling any mutating endpoint, then each planned action is mapped to its
+  endpoint and costed against the current quota reported by Twitter.
+  '''
+  def __init__(self, api, clock=time.time, meta_list_state=None,
+               mutation_queue=None):
+    self.api = api
+    self.clock = clock
+    # Read to plan meta-list rebuilds, never written.
+    self.meta_list_state = meta_list_state
+    # Read for the daily quota already used, never written.
+    self.mutation_queue = mutation_queue
+
+  def Estimate(self, api_account, config_account):
+    planner = _PlanningMerger(
+        self.meta_list_state.Copy() if self.meta_list_state else None)
+    planner.MergeAccounts(_CopyAccount(api_account),
+                          _CopyAccount(config_account))
+    items = dict(planner.planned)
+    calls = {action: math.ceil(count / ENDPOINTS[action].batch_size)
+             for action, count in items.items()}
+    # The sync re-downloads the account before merging.
+    api_lists = list(api_account.lists) + [ml.twitter_list
+                                           for ml in api_account.meta_lists]
+    items['get_friends'] = len(api_account.follows)
+    calls['get_friends'] = _Pages(len(api_account.follows), FRIENDS_PAGE_SIZE)
+    items['get_lists'] = len(api_lists)
+    calls['get_lists'] = 1
+    items['get_list_members'] = sum(len(l.members) for l in api_lists)
+    calls['get_list_members'] = sum(
+        _Pages(len(l.members), SYNC_LIST_MEMBERS_PAGE_SIZE)
+        for l in api_lists)
+    api_blocks = api_account.blocks or []
+    api_mutes = api_account.mutes or []
+    items['get_block_ids'] = len(api_blocks)
+    calls['get_block_ids'] = _Pages(len(api_blocks), IDS_PAGE_SIZE)
+    items['get_mute_ids'] = len(api_mutes)
+    calls['get_mute_ids'] = _Pages(len(api_mutes), IDS_PAGE_SIZE)
+    items['users_lookup'] = len(api_blocks) + len(api_mutes)
+    calls['users_lookup'] = sum(
+        math.ceil(len(users) / USERS_LOOKUP_BATCH_SIZE)
+        for users in (api_blocks, api_mutes))
+    estimates = []
+    for action, endpoint in ENDPOINTS.items():
+      if not calls[action]:
+        continue
+      estimates.append(EndpointEstimate(
+          endpoint=endpoint,
+          items=items[action],
+          calls=calls[action],
+          min_secs=self._MinSecs(action, endpoint, calls[action])))
+    return SyncEstimate(endpoints=estimates)
+
+  def _MinSecs(self, action, endpoint, calls):
+    if endpoint.window_calls is None:
+      return 0
+    now = self.clock()
+    remaining, reset = self._Quota(action, endpoint, now)
+    if calls <= remaining:
+      return 0
+    windows = math.ceil((calls - remaining) / endpoint.window_calls)
+    return max(0, reset - now) + (windows - 1) * endpoint.window_secs
+
+  def _Quota(self, action, endpoint, now):
+    '''Returns (remaining calls, reset timestamp) for the current window.'''
+    if action in DAILY_CAPS and self.mutation_queue:
+      # Twitter does not report daily caps, the queue tracks their use.
+      return self.mutation_queue.Quota(action)
+    if endpoint.url:
+      try:
+        limit = self.api.CheckRateLimit(self.api.base_url + endpoint.url)
+        if limit.reset:
+          return limit.remaining, limit.reset
+      except twitter.TwitterError as e:
+        print('   Error reading quota for {0}: {1}'.format(endpoint.name, e))
+    # Unknown window start so assume a full window must elapse.
+    return endpoint.window_calls, now + endpoint.window_secs
+
+
+def _Pages(count, page_size):
+  return max(1, math.ceil(count / page_size))
+
+
+def _CopyAccount(account):
+  return dataclasses.replace(
+      account,
+      follows=list(account.follows),
+      lists=[dataclasses.replace(l, members=list(l.members))
+             for l in account.lists],
+      meta_lists=[_CopyMetaList(ml) for ml in account.meta_lists],
+      blocks=_CopyUsers(account.blocks),
+      mutes=_CopyUsers(account.mutes))
+
+
+def _CopyUsers(users):
+  return None if users is None else list(users)
+
+
+def _CopyMetaList(meta_list):
+  if not meta_list.twitter_list:
+    return meta_list
+  return dataclasses.replace(
+      meta_list,
+      twitter_list=dataclasses.replace(
+          meta_list.twitter_list,
+          members=list(meta_list.twitter_list.members)))
+
+
+def _FormatSecs(secs):
+  hours, rem = divmod(int(math.ceil(secs)), 60 * 60)
+  return '{0}h{1:02d}m{2:02d}s'.format(hours, rem // 60, rem % 60)
@@ -0,0 +1,144 @@
+import bisect
+import gzip
+import json
+import os
+import tempfile
+import time
+
+
+INDEX_FILE = 'index.json'
+# Deltas written after each full checkpoint, bounding the records replayed
+# to reconstruct any state.
+DEFAULT_CHECKPOINT_INTERVAL = 30
+
+
+def AccountFacts(account):
+  '''Flattens a TwitterAccount into a set of hashable facts.
+
+  Facts are tuples such as ('follow', username) or ('member', list, username)
+  so two states are compared, and stored as deltas, with plain set
+  operations.
+  '''
+  facts = set()
+  for user in account.follows:
+    facts.add(('follow', user.username))
+  for user in account.blocks or []:
+    facts.add(('block', user.username))
+  for user in account.mutes or []:
+    facts.add(('mute', user.username))
+  lists = list(account.lists) + [ml.twitter_list for ml in account.meta_lists
+                                 if ml.twitter_list]
+  for l in lists:
+    facts.add(('list', l.name, l.is_private))
+    for user in l.members:
+      facts.add(('member', l.name, user.username))
+  for ml in account.meta_lists:
+    for list_name in ml.lists or []:
+      facts.add(('meta_list', ml.name, list_name))
+  return facts
+
+
+def DescribeFact(fact):
+  kind = fact[0]
+  if kind == 'list':
+    return 'list "{0}" ({1})'.format(fact[1],
+                                     'private' if fact[2] else 'public')
+  if kind == 'member':
+    return '@{0} in list "{1}"'.format(fact[2], fact[1])
+  if kind == 'meta_list':
+    return 'list "{0}" in meta-list "{1}"'.format(fact[2], fact[1])
+  return '{0} @{1}'.format(kind, fact[1])
+
+
+class HistoryStore:
+  '''Append-only history of observed account states.
+
+  Each state is stored as a delta of facts against the previous one, with a
+  full checkpoint every checkpoint_interval records. Every checkpoint starts
+  a new gzip segment file, so reconstructing a state reads one checkpoint
+  and at most checkpoint_interval deltas regardless of how long the history
+  is. A small index maps timestamps to segments.
+  '''
+  def __init__(self, path, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+               clock=time.time):
+    self.path = path
+    self.checkpoint_interval = checkpoint_interval
+    self.clock = clock
+    # entries[seq] = [timestamp, segment number, kind]
+    self.entries = []
+    index_path = os.path.join(path, INDEX_FILE)
+    if os.path.exists(index_path):
+      with open(index_path, 'r') as stream:
+        self.entries = json.load(stream)['entries']
+
+  def Timestamps(self):
+    return [entry[0] for entry in self.entries]
+
+  def Record(self, account, timestamp=None):
+    '''Appends the account's current state, returns the number of changes.'''
+    timestamp = self.clock() if timestamp is None else timestamp
+    if self.entries and timestamp < self.entries[-1][0]:
+      raise ValueError('History timestamps must not go backwards')
+    facts = AccountFacts(account)
+    seq = len(self.entries)
+    previous = self._StateAtSeq(seq - 1) if self.entries else set()
+    added = facts - previous
+    removed = previous - facts
+    deltas = sum(1 for entry in self.entries
+                 if entry[1] == self.entries[-1][1] and entry[2] == 'delta')
+    if not self.entries or deltas >= self.checkpoint_interval:
+      segment = self.entries[-1][1] + 1 if self.entries else 0
+      kind = 'checkpoint'
+      record = {'seq': seq, 'facts': sorted(facts)}
+    else:
+      segment = self.entries[-1][1]
+      kind = 'delta'
+      record = {'seq': seq, 'added': sorted(added), 'removed': sorted(removed)}
+    os.makedirs(self.path, exist_ok=True)
+    with gzip.open(self._SegmentPath(segment), 'at') as stream:
+      stream.write(json.dumps(record) + '\n')
+    self.entries.append([timestamp, segment, kind])
+    self._SaveIndex()
+    return len(added) + len(removed)
+
+  def StateAt(self, timestamp):
+    '''Returns the facts observed at or most recently before timestamp.'''
+    seq = bisect.bisect_right(self.Timestamps(), timestamp) - 1
+    if seq < 0:
+      return set()
+    return self._StateAtSeq(seq)
+
+  def Diff(self, from_timestamp, to_timestamp):
+    '''Returns the sorted (added, removed) facts between two times.'''
+    before = self.StateAt(from_timestamp)
+    after = self.StateAt(to_timestamp)
+    return sorted(after - before), sorted(before - after)
+
+  def _StateAtSeq(self, seq):
+    segment = self.entries[seq][1]
+    records = {}
+    with gzip.open(self._SegmentPath(segment), 'rt') as stream:
+      for line in stream:
+        record = json.loads(line)
+        # A record with a repeated seq was rewritten after an interrupted
+        # Record(), the latest copy wins.
+        if record['seq'] <= seq:
+          records[record['seq']] = record
+    state = set()
+    for record_seq in sorted(records):
+      record = records[record_seq]
+      if 'facts' in record:
+        state = {tuple(fact) for fact in record['facts']}
+      else:
+        state.difference_update(tuple(fact) for fact in record['removed'])
+        state.update(tuple(fact) for fact in record['added'])
+    return state
+
+  def _SegmentPath(self, segment):
+    return os.path.join(self.path, 'segment-{0:06d}.jsonl.gz'.format(segment))
+
+  def _SaveIndex(self):
+    with tempfile.NamedTemporaryFile('w', dir=self.path,
+                                     delete=False) as stream:
+      json.dump({'entries': self.entries}, stream)
+    os.replace(stream.name, os.path.join(self.path, INDEX_FILE))
@@ -0,0 +1,44 @@
+import json
+import os
+import tempfile
+
+
+class MetaListState:
+  '''Durable record of the lists each meta-list was last synced from.
+
+  Meta-list members are normally updated from the changes made to their
+  lists, which misses edits to a meta-list's own lists. Comparing against
+  the composition recorded here tells a sync which meta-lists must be
+  rebuilt from scratch instead. Without a path nothing is persisted.
+  '''
+  def __init__(self, path=None):
+    self.path = path
+    self.compositions = {} # dict[str, list[str]]
+    if path and os.path.exists(path):
+      with open(path, 'r') as stream:
+        self.compositions = json.load(stream)
+
+  def Matches(self, meta_list):
+    '''Whether the meta-list was last synced from the lists it has now.'''
+    return self.compositions.get(meta_list.name) == sorted(meta_list.lists)
+
+  def Put(self, meta_list):
+    self.compositions[meta_list.name] = sorted(meta_list.lists)
+
+  def Remove(self, name):
+    self.compositions.pop(name, None)
+
+  def Copy(self):
+    '''Returns an unpersisted copy, for planning without side effects.'''
+    state = MetaListState()
+    state.compositions = dict(self.compositions)
+    return state
+
+  def Save(self):
+    if not self.path:
+      return
+    state_dir = os.path.dirname(os.path.abspath(self.path))
+    with tempfile.NamedTemporaryFile('w', dir=state_dir,
+                                     delete=False) as stream:
+      json.dump(self.compositions, stream)
+    os.replace(stream.name, self.path)
@@ -1,8 +1,34 @@
 import dataclasses
 import yaml
 
+from twitterbyconfig.configloader import (
+    ConfigLoader,
+)
+
 
 META_LIST_PREFIX = 'META'
+# Max number of users which can be hydrated by a single UsersLookup call.
+USERS_LOOKUP_BATCH_SIZE = 100
+# Users per page of GetFriends, used by both sync and the streamed download.
+FRIENDS_PAGE_SIZE = 200
+# Members per page of GetListMembers, python-twitter's default, which sync
+# downloads lists with.
+SYNC_LIST_MEMBERS_PAGE_SIZE = 100
+# Members per page requested by the streamed download, Twitter's maximum.
+STREAM_LIST_MEMBERS_PAGE_SIZE = 5000
+# IDs per page of the ID-only block and mute endpoints.
+IDS_PAGE_SIZE = 5000
+
+
+def IterPaged(get_page):
+  '''Yields the items of a cursored endpoint, get_page(cursor) per page.'''
+  cursor = -1
+  while True:
+    next_cursor, previous_cursor, page = get_page(cursor)
+    yield from page
+    if next_cursor == 0 or next_cursor == previous_cursor:
+      break
+    cursor = next_cursor
 
 
 @dataclasses.dataclass
@@ -147,6 +173,10 @@ class TwitterAccount:
   follows: list = None # list[TwitterUser] 
   lists: list = None # list[TwitterList]
   meta_lists: list = None # list[MetaList]
+  # Optional in config files, None when the config does not manage them as
+  # opposed to an empty list which means blocking or muting nobody.
+  blocks: list = None # list[TwitterUser]
+  mutes: list = None # list[TwitterUser]
 
   def ToConfigDict(self):
     sorted_follows = sorted(self.follows,
@@ -155,11 +185,17 @@ class TwitterAccount:
                           key=lambda lst: lst.name.lower())
     sorted_meta_lists = sorted(self.meta_lists,
                                key=lambda lst: lst.name.lower())
-    return {
+    config_dict = {
       'follows': [follow.ToConfigDict() for follow in sorted_follows],
       'lists': [l.ToConfigDict() for l in sorted_lists],
       'meta_lists': [ml.ToConfigDict() for ml in sorted_meta_lists],
     }
+    # Unmanaged sections are left out so they stay unmanaged.
+    for key, users in (('blocks', self.blocks), ('mutes', self.mutes)):
+      if users is not None:
+        config_dict[key] = [user.ToConfigDict() for user in sorted(
+            users, key=lambda user: user.username.lower())]
+    return config_dict
 
   def WriteToConfig(self, config_file):
     with open(config_file, 'w') as stream:
@@ -172,35 +208,75 @@ class TwitterAccount:
                           lists=[TwitterList.FromConfigDict(l)
                                  for l in d.get('lists', [])],
                           meta_lists=[MetaList.FromConfigDict(ml)
-                                      for ml in d.get('meta_lists', [])])
+                                      for ml in d.get('meta_lists', [])],
+                          blocks=TwitterAccount._OptionalUsers(d, 'blocks'),
+                          mutes=TwitterAccount._OptionalUsers(d, 'mutes'))
+
+  @staticmethod
+  def _OptionalUsers(d, key):
+    if key not in d:
+      return None
+    return [TwitterUser.FromConfigDict(user) for user in d[key] or []]
 
   @staticmethod
   def FromApi(twitter_api):
     account = TwitterAccount()
-    # Follows
-    account.follows = [TwitterUser.FromPythonTwitter(friend)
-                       for friend in twitter_api.GetFriends()]
+    account.follows = TwitterAccount.FollowsFromApi(twitter_api)
     # Lists and Meta-lists
     account.lists = []
     account.meta_lists = []
-    lists = twitter_api.GetLists()
-    for l in lists:
-      members = twitter_api.GetListMembers(list_id=l.id)
-      twitter_list = TwitterList.FromPythonTwitter(l, members)
+    for l in twitter_api.GetLists():
+      twitter_list = TwitterList.FromPythonTwitter(
+          l, twitter_api.GetListMembers(list_id=l.id))
       if MetaList.IsMetaList(l.name):
         account.meta_lists.append(MetaList.FromTwitterList(twitter_list))
       else:
         account.lists.append(twitter_list)
+    account.blocks = TwitterAccount.BlocksFromApi(twitter_api)
+    account.mutes = TwitterAccount.MutesFromApi(twitter_api)
     return account
 
   @staticmethod
-  def ReadFromConfig(config_file):
-    with open(config_file, 'r') as stream:
-      try:
-        return TwitterAccount.FromConfigDict(yaml.safe_load(stream))
-      except yaml.YAMLError as e:
-        print('Error reading account data from {0}: {1}'.format(config_file,
-                                                                e))
-    return None
+  def FollowsFromApi(twitter_api):
+    return [TwitterUser.FromPythonTwitter(friend)
+            for friend in twitter_api.GetFriends()]
+
+  @staticmethod
+  def BlocksFromApi(twitter_api):
+    return TwitterAccount._GetUsersByIds(twitter_api,
+                                         twitter_api.GetBlocksIDsPaged)
+
+  @staticmethod
+  def MutesFromApi(twitter_api):
+    return TwitterAccount._GetUsersByIds(twitter_api,
+                                         twitter_api.GetMutesIDsPaged)
 
+  @staticmethod
+  def _GetUsersByIds(twitter_api, get_ids_paged):
+    '''Downloads users via an ID-only paged endpoint plus bulk lookup.
+
+    The ID endpoints return up to IDS_PAGE_SIZE IDs per page which keeps
+    large block and mute collections to a handful of calls before hydrating
+    usernames in batches of USERS_LOOKUP_BATCH_SIZE.
+    '''
+    ids = list(IterPaged(lambda cursor: get_ids_paged(cursor=cursor)))
+    users = []
+    for i in range(0, len(ids), USERS_LOOKUP_BATCH_SIZE):
+      users.extend(TwitterUser.FromPythonTwitter(user)
+                   for user in twitter_api.UsersLookup(
+                       user_id=ids[i:i + USERS_LOOKUP_BATCH_SIZE]))
+    return users
 
+  @staticmethod
+  def ReadFromConfig(config_file, cache=None):
+    '''Reads an account from a config file and the files it includes.
+
+    An optional ConfigCache avoids re-parsing unchanged files.
+    '''
+    try:
+      return TwitterAccount.FromConfigDict(
+          ConfigLoader(cache=cache).Load(config_file))
+    except yaml.YAMLError as e:
+      print('Error reading account data from {0}: {1}'.format(config_file,
+                                                              e))
+    return None
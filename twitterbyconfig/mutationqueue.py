@@ -0,0 +1,220 @@
+import dataclasses
+import json
+import os
+import tempfile
+import time
+import twitter
+
+
+DAY_SECS = 24 * 60 * 60
+# Rolling 24 hour caps enforced by Twitter. The list member cap is not
+# documented and is based on observed behaviour.
+DAILY_CAPS = {
+  'follow': 400,
+  'add_list_member': 1000,
+}
+# Lower values are applied first. Follows go before list additions since a
+# list entry for someone not yet followed is of little use.
+ACTION_PRIORITIES = {
+  'follow': 0,
+  'add_list_member': 1,
+}
+# Twitter error codes meaning the caller is over a rate or daily limit:
+# 88 rate limit exceeded, 161 unable to follow more people at this time.
+QUOTA_ERROR_CODES = (88, 161)
+# How long to hold off an action after Twitter reports it is over quota.
+QUOTA_ERROR_BACKOFF_SECS = 60 * 60
+
+
+@dataclasses.dataclass
+class Mutation:
+  '''A capped API action waiting to be applied.'''
+  action: str = None
+  username: str = None
+  # Only present for list actions.
+  list_id: int = None
+  list_name: str = None
+  enqueued_at: float = None
+
+  def Key(self):
+    return (self.action, self.username, self.list_id)
+
+  def Describe(self):
+    if self.list_name:
+      return '{0} @{1} to list "{2}"'.format(self.action, self.username,
+                                              self.list_name)
+    return '{0} @{1}'.format(self.action, self.username)
+
+
+def IsQuotaError(error):
+  '''Whether a TwitterError was caused by a rate or daily limit.'''
+  messages = error.message if isinstance(error.message, list) else [
+      error.message]
+  return any(isinstance(m, dict) and m.get('code') in QUOTA_ERROR_CODES
+             for m in messages)
+
+
+class MutationQueue:
+  '''Durable queue of capped mutations plus the quota they have used.
+
+  Follows and list member additions beyond Twitter's daily caps are stored
+  on disk so that later runs, see `main.py drain`, can keep applying them
+  until the account converges on its config. The file is rewritten
+  atomically on Save().
+  '''
+  def __init__(self, path, clock=time.time):
+    self.path = path
+    self.clock = clock
+    self.mutations = [] # list[Mutation]
+    # Timestamps of applied mutations within the last day, per action.
+    self.history = {action: [] for action in DAILY_CAPS}
+    self.blocked_until = {} # dict[str, float]
+    if os.path.exists(path):
+      with open(path, 'r') as stream:
+        state = json.load(stream)
+      self.mutations = [Mutation(**m) for m in state['mutations']]
+      self.history.update(state['history'])
+      self.blocked_until = state['blocked_until']
+
+  def Enqueue(self, mutation):
+    if any(m.Key() == mutation.Key() for m in self.mutations):
+      return
+    if mutation.enqueued_at is None:
+      mutation.enqueued_at = self.clock()
+    self.mutations.append(mutation)
+
+  def Pending(self):
+    '''Returns the queued mutations in the order they should be applied.'''
+    return sorted(self.mutations,
+                  key=lambda m: (ACTION_PRIORITIES.get(m.action, 0),
+                                 m.enqueued_at))
+
+  def Remove(self, mutation):
+    self.mutations = [m for m in self.mutations if m.Key() != mutation.Key()]
+
+  def HasQuota(self, action):
+    if action not in DAILY_CAPS:
+      return True
+    now = self.clock()
+    if self.blocked_until.get(action, 0) > now:
+      return False
+    return len(self._RecentHistory(action, now)) < DAILY_CAPS[action]
+
+  def Quota(self, action):
+    '''Returns (remaining calls, reset timestamp) for a capped action.
+
+    The reset is when the oldest call within the last day drops out of the
+    rolling window, or a full day from now if there is none.
+    '''
+    now = self.clock()
+    if self.blocked_until.get(action, 0) > now:
+      return 0, self.blocked_until[action]
+    recent = self._RecentHistory(action, now)
+    return (max(0, DAILY_CAPS[action] - len(recent)),
+            recent[0] + DAY_SECS if recent else now + DAY_SECS)
+
+  def RecordApplied(self, action):
+    if action in DAILY_CAPS:
+      self.history[action] = self._RecentHistory(action, self.clock()) + [
+          self.clock()]
+
+  def RecordQuotaError(self, action):
+    self.blocked_until[action] = self.clock() + QUOTA_ERROR_BACKOFF_SECS
+
+  def NextQuotaTime(self):
+    '''Earliest time at which some queued mutation may be applied.'''
+    times = []
+    now = self.clock()
+    for action in {m.action for m in self.mutations}:
+      if self.HasQuota(action):
+        return now
+      recent = self._RecentHistory(action, now)
+      times.append(max(self.blocked_until.get(action, 0),
+                       recent[0] + DAY_SECS if recent else 0))
+    return min(times, default=now)
+
+  def Prune(self, config_account):
+    '''Drops mutations which the config no longer asks for.'''
+    follows = {user.username for user in config_account.follows}
+    list_members = {l.name: {user.username for user in l.members}
+                    for l in config_account.lists}
+    def Wanted(m):
+      if m.action == 'follow':
+        return m.username in follows
+      if m.list_name in list_members:
+        return m.username in list_members[m.list_name]
+      # Meta-list members are derived from their lists.
+      meta_list = next((ml for ml in config_account.meta_lists
+                        if ml.name == m.list_name), None)
+      return meta_list is not None and any(
+          m.username in list_members.get(name, ())
+          for name in meta_list.lists)
+    self.mutations = [m for m in self.mutations if Wanted(m)]
+
+  def Save(self):
+    state = {
+      'mutations': [dataclasses.asdict(m) for m in self.mutations],
+      'history': self.history,
+      'blocked_until': self.blocked_until,
+    }
+    queue_dir = os.path.dirname(os.path.abspath(self.path))
+    with tempfile.NamedTemporaryFile('w', dir=queue_dir,
+                                     delete=False) as stream:
+      json.dump(state, stream)
+    os.replace(stream.name, self.path)
+
+  def _RecentHistory(self, action, now):
+    return [t for t in self.history.get(action, []) if t > now - DAY_SECS]
+
+
+class QueueDrainer:
+  '''Applies queued mutations while daily quota remains.'''
+  def __init__(self, api, queue, sleep=time.sleep):
+    self.api = api
+    self.queue = queue
+    self.sleep = sleep
+
+  def Drain(self, wait=False):
+    '''Applies pending mutations, returns how many were applied.
+
+    When wait is set, sleeps until quota frees up and keeps going until the
+    queue is empty. The queue is saved after every mutation.
+    '''
+    applied = 0
+    while self.queue.mutations:
+      progressed = False
+      for mutation in self.queue.Pending():
+        if not self.queue.HasQuota(mutation.action):
+          continue
+        progressed = True
+        try:
+          self._Apply(mutation)
+          self.queue.RecordApplied(mutation.action)
+          self.queue.Remove(mutation)
+          applied += 1
+          print('    Applied: {0}'.format(mutation.Describe()))
+        except twitter.TwitterError as e:
+          if IsQuotaError(e):
+            self.queue.RecordQuotaError(mutation.action)
+          else:
+            print('   Error applying {0}, dropping it: {1}'.format(
+                mutation.Describe(), e))
+            self.queue.Remove(mutation)
+        self.queue.Save()
+      if not progressed:
+        if not wait:
+          break
+        delay = max(0, self.queue.NextQuotaTime() - self.queue.clock())
+        print('Daily limits reached, waiting {0:.0f}s for quota...'.format(
+            delay))
+        self.sleep(delay)
+    return applied
+
+  def _Apply(self, mutation):
+    if mutation.action == 'follow':
+      self.api.CreateFriendship(screen_name=mutation.username)
+    elif mutation.action == 'add_list_member':
+      self.api.CreateListsMember(list_id=mutation.list_id,
+                                 screen_name=mutation.username)
+    else:
+      raise ValueError('Unsupported mutation: {0}'.format(mutation.action))
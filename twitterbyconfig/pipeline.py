@@ -0,0 +1,155 @@
+import concurrent.futures
+import threading
+
+from twitterbyconfig.models import (
+    TwitterUser,
+    TwitterList,
+    MetaList,
+    TwitterAccount,
+)
+
+
+# Downloads run concurrently, kept below TransportConfig.pool_maxsize so
+# every worker gets a pooled connection.
+DEFAULT_MAX_WORKERS = 4
+
+
+def Resolve(value):
+  '''Waits for a value which may still be arriving from a SyncPipeline.'''
+  if isinstance(value, concurrent.futures.Future):
+    return value.result()
+  return value
+
+
+def ResolveAccount(account):
+  '''Waits for every part of a pipelined account to arrive.'''
+  lists = Resolve(account.lists)
+  meta_lists = Resolve(account.meta_lists)
+  for l in lists + [ml.twitter_list for ml in meta_lists]:
+    l.members = Resolve(l.members)
+  return TwitterAccount(follows=Resolve(account.follows),
+                        lists=lists,
+                        meta_lists=meta_lists,
+                        blocks=Resolve(account.blocks),
+                        mutes=Resolve(account.mutes))
+
+
+class SyncPipeline:
+  '''Reads the config and downloads the account on background threads.
+
+  Every piece of the account is a Future which AccountMerger resolves right
+  before merging it, so follows are merged as soon as the friend pages have
+  arrived and each list as soon as its own members have, while the rest of
+  the account is still downloading. Prompts and writes stay on the calling
+  thread. Work is scheduled in the order it is merged in, so blocks and mutes
+  only start downloading once every list's members have been scheduled.
+  '''
+  def __init__(self, api, max_workers=DEFAULT_MAX_WORKERS):
+    self.api = api
+    self.executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_workers)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.Close()
+
+  def Close(self):
+    self.executor.shutdown(wait=False, cancel_futures=True)
+
+  def ReadConfig(self, config_file, cache=None):
+    '''Returns a Future of the TwitterAccount read from config_file.'''
+    return self.executor.submit(TwitterAccount.ReadFromConfig, config_file,
+                                cache)
+
+  def DownloadAccount(self, config_account=None):
+    '''Returns a TwitterAccount whose parts are Futures, see Resolve.
+
+    When config_account, or a Future of it, is given blocks and mutes are
+    only downloaded if the config manages them, otherwise they are None.
+    '''
+    account = TwitterAccount()
+    account.follows = self.executor.submit(TwitterAccount.FollowsFromApi,
+                                           self.api)
+    all_lists = self.executor.submit(self._DownloadLists)
+    account.lists = _Map(all_lists, lambda lists: [
+        l for l in lists if not MetaList.IsMetaList(l.name)])
+    account.meta_lists = _Map(all_lists, lambda lists: [
+        MetaList.FromTwitterList(l) for l in lists
+        if MetaList.IsMetaList(l.name)])
+    account.blocks = self._DownloadSection(all_lists, config_account,
+                                           'blocks',
+                                           TwitterAccount.BlocksFromApi)
+    account.mutes = self._DownloadSection(all_lists, config_account, 'mutes',
+                                          TwitterAccount.MutesFromApi)
+    return account
+
+  def _DownloadSection(self, after, config_account, key, download):
+    '''Submits download once after is done, if the config manages key.'''
+    section = concurrent.futures.Future()
+    def Submit():
+      try:
+        if (config_account is not None and
+            getattr(Resolve(config_account), key) is None):
+          section.set_result(None)
+          return
+        _Forward(self.executor.submit(download, self.api), section)
+      except BaseException as e:
+        section.set_exception(e)
+    _WhenAll([f for f in (after, config_account)
+              if isinstance(f, concurrent.futures.Future)], Submit)
+    return section
+
+  def _DownloadLists(self):
+    lists = []
+    for l in self.api.GetLists():
+      twitter_list = TwitterList.FromPythonTwitter(l, [])
+      twitter_list.members = self.executor.submit(self._DownloadMembers,
+                                                  l.id)
+      lists.append(twitter_list)
+    return lists
+
+  def _DownloadMembers(self, list_id):
+    return [TwitterUser.FromPythonTwitter(member)
+            for member in self.api.GetListMembers(list_id=list_id)]
+
+
+def _WhenAll(futures, fn):
+  '''Calls fn without blocking once every one of futures is done.'''
+  lock = threading.Lock()
+  remaining = [len(futures)]
+  def Done(_):
+    with lock:
+      remaining[0] -= 1
+      last = remaining[0] == 0
+    if last:
+      fn()
+  if not futures:
+    fn()
+  for future in futures:
+    future.add_done_callback(Done)
+
+
+def _Forward(source, target):
+  '''Completes target with the outcome of source.'''
+  def Done(done):
+    if done.cancelled():
+      target.cancel()
+    elif done.exception() is not None:
+      target.set_exception(done.exception())
+    else:
+      target.set_result(done.result())
+  source.add_done_callback(Done)
+
+
+def _Map(future, fn):
+  '''Returns a Future of fn applied to the result of future.'''
+  mapped = concurrent.futures.Future()
+  def Done(done):
+    try:
+      mapped.set_result(fn(done.result()))
+    except BaseException as e:
+      mapped.set_exception(e)
+  future.add_done_callback(Done)
+  return mapped
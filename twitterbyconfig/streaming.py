@@ -0,0 +1,180 @@
+import heapq
+import json
+import os
+import re
+import shutil
+import tempfile
+import yaml
+
+from twitterbyconfig.models import (
+    FRIENDS_PAGE_SIZE,
+    STREAM_LIST_MEMBERS_PAGE_SIZE,
+    USERS_LOOKUP_BATCH_SIZE,
+    IterPaged,
+    MetaList,
+)
+
+
+# Entries held in memory per section before a sorted run is spilled to disk.
+DEFAULT_RUN_SIZE = 10000
+# Usernames which PyYAML emits as plain scalars, checked further below.
+_PLAIN_USERNAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]{0,49}$')
+_RESOLVER = yaml.resolver.Resolver()
+
+
+class ExternalSorter:
+  '''Stable sort of (key, line) records with bounded memory.
+
+  Records are buffered until run_size is reached and then written to a
+  temporary file as a sorted run. Lines() merges the runs, which keeps the
+  order of records with equal keys the same as sorted() would.
+  '''
+  def __init__(self, run_size=DEFAULT_RUN_SIZE):
+    self.run_size = run_size
+    self.buffer = []
+    self.runs = []
+    self.count = 0
+
+  def Add(self, key, line):
+    self.buffer.append((key, line))
+    self.count += 1
+    if len(self.buffer) >= self.run_size:
+      self._Spill()
+
+  def Lines(self):
+    if not self.runs:
+      self.buffer.sort(key=lambda record: record[0])
+      yield from (line for _, line in self.buffer)
+      return
+    self._Spill()
+    runs = [(json.loads(record) for record in run) for run in self.runs]
+    try:
+      yield from (line for _, line in heapq.merge(*runs,
+                                                  key=lambda r: r[0]))
+    finally:
+      self.Close()
+
+  def Close(self):
+    for run in self.runs:
+      run.close()
+    self.runs = []
+
+  def _Spill(self):
+    if not self.buffer:
+      return
+    self.buffer.sort(key=lambda record: record[0])
+    run = tempfile.TemporaryFile(mode='w+')
+    for record in self.buffer:
+      run.write(json.dumps(record) + '\n')
+    run.seek(0)
+    self.runs.append(run)
+    self.buffer = []
+
+
+class StreamingConfigWriter:
+  '''Writes a config section by section in the format of WriteToConfig.
+
+  Sections must be written in sorted key order, matching yaml.dump. Each
+  entry is rendered in the context it appears in so that quoting and line
+  wrapping are byte-identical to dumping the whole account at once.
+  '''
+  def __init__(self, stream):
+    self.stream = stream
+
+  def WriteUsers(self, key, sorter):
+    self.BeginSection(key, empty=not sorter.count)
+    self.stream.writelines(sorter.Lines())
+
+  def BeginSection(self, key, empty):
+    self.stream.write('{0}: []\n'.format(key) if empty else key + ':\n')
+
+  def WriteList(self, name, is_private, sorter):
+    header = yaml.dump({'lists': [{'is_private': is_private,
+                                   'members': [],
+                                   'name': name}]})
+    header = header[len('lists:\n'):]
+    if not sorter.count:
+      self.stream.write(header)
+      return
+    before, after = header.split('  members: []\n', 1)
+    self.stream.write(before + '  members:\n')
+    self.stream.writelines(sorter.Lines())
+    self.stream.write(after)
+
+
+def UserLine(username, indent=''):
+  '''Renders a user as the sequence entry yaml.dump would produce.'''
+  if (_PLAIN_USERNAME.match(username) and
+      _RESOLVER.resolve(yaml.ScalarNode, username, (True, False)) ==
+      _RESOLVER.DEFAULT_SCALAR_TAG):
+    return '{0}- username: {1}\n'.format(indent, username)
+  if indent:
+    dumped = yaml.dump({'lists': [{'members': [{'username': username}]}]})
+    return dumped.split('\n', 2)[-1]
+  dumped = yaml.dump({'follows': [{'username': username}]})
+  return dumped.split('\n', 1)[-1]
+
+
+def StreamAccountToConfig(twitter_api, config_file,
+                          run_size=DEFAULT_RUN_SIZE):
+  '''Downloads an account straight into a config file.
+
+  Pages from Twitter are sorted through ExternalSorter and written out as
+  each section completes, so peak memory is bounded by run_size rather than
+  the size of the account. The output is byte-identical to
+  TwitterAccount.FromApi(...).WriteToConfig(...) except that meta-lists are
+  not downloaded. The config is replaced only once fully written.
+  '''
+  config_dir = os.path.dirname(os.path.abspath(config_file))
+  with tempfile.NamedTemporaryFile('w', dir=config_dir, delete=False) as out:
+    try:
+      writer = StreamingConfigWriter(out)
+      writer.WriteUsers('blocks', _SortUsers(
+          _IterUsersByIds(twitter_api, twitter_api.GetBlocksIDsPaged),
+          run_size))
+      writer.WriteUsers('follows', _SortUsers(
+          IterPaged(lambda cursor: twitter_api.GetFriendsPaged(
+              cursor=cursor, count=FRIENDS_PAGE_SIZE, skip_status=True,
+              include_user_entities=False)),
+          run_size))
+      lists = sorted((l for l in twitter_api.GetLists()
+                      if not MetaList.IsMetaList(l.name)),
+                     key=lambda l: l.name.lower())
+      writer.BeginSection('lists', empty=not lists)
+      for l in lists:
+        members = IterPaged(
+            lambda cursor, list_id=l.id: twitter_api.GetListMembersPaged(
+                list_id=list_id, cursor=cursor,
+                count=STREAM_LIST_MEMBERS_PAGE_SIZE, skip_status=True,
+                include_entities=False))
+        writer.WriteList(l.name, l.mode == 'private',
+                         _SortUsers(members, run_size, indent='  '))
+      writer.BeginSection('meta_lists', empty=True)
+      writer.WriteUsers('mutes', _SortUsers(
+          _IterUsersByIds(twitter_api, twitter_api.GetMutesIDsPaged),
+          run_size))
+    except BaseException:
+      out.close()
+      os.remove(out.name)
+      raise
+  if os.path.exists(config_file):
+    shutil.copymode(config_file, out.name)
+  os.replace(out.name, config_file)
+
+
+def _SortUsers(users, run_size, indent=''):
+  sorter = ExternalSorter(run_size)
+  for user in users:
+    sorter.Add(user.screen_name.lower(), UserLine(user.screen_name, indent))
+  return sorter
+
+
+def _IterUsersByIds(twitter_api, get_ids_paged):
+  batch = []
+  for user_id in IterPaged(lambda cursor: get_ids_paged(cursor=cursor)):
+    batch.append(user_id)
+    if len(batch) == USERS_LOOKUP_BATCH_SIZE:
+      yield from twitter_api.UsersLookup(user_id=batch)
+      batch = []
+  if batch:
+    yield from twitter_api.UsersLookup(user_id=batch)
@@ -0,0 +1,98 @@
+import dataclasses
+import random
+import time
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+
+
+# Writes which are safe to repeat, e.g. after a read timeout where the first
+# attempt may already have been applied, since repeating one leaves the
+# account in the same state. Any other write is never retried.
+IDEMPOTENT_WRITES = (
+  '/friendships/create.json',
+  '/friendships/destroy.json',
+  '/lists/members/create.json',
+  '/lists/members/create_all.json',
+  '/lists/members/destroy.json',
+  '/lists/members/destroy_all.json',
+  '/lists/destroy.json',
+  '/blocks/create.json',
+  '/blocks/destroy.json',
+  '/mutes/users/create.json',
+  '/mutes/users/destroy.json',
+)
+
+
+@dataclasses.dataclass
+class TransportConfig:
+  '''Settings for the HTTP transport used to reach the Twitter API.'''
+  # Kept-alive connections are pooled per host.
+  pool_connections: int = 4
+  pool_maxsize: int = 16
+  # Seconds to wait for a connection or a response.
+  timeout: float = 30
+  # Retries after the first attempt, 0 disables retrying.
+  max_retries: int = 5
+  # Retry delays are drawn uniformly from [0, min(max, base * 2^attempt)].
+  backoff_base_secs: float = 0.5
+  backoff_max_secs: float = 30
+  retry_statuses: tuple = (500, 502, 503, 504)
+
+
+class RetryingSession(requests.Session):
+  '''requests.Session with pooled keep-alive connections and retries.
+
+  Reads and idempotent writes are retried with jittered exponential backoff
+  when the connection fails, times out or the server returns one of the
+  configured transient statuses. Rate limit responses (429) are not retried
+  since they only clear once the window resets.
+  '''
+  def __init__(self, config=None, sleep=time.sleep, rand=random.random):
+    super().__init__()
+    self.config = config or TransportConfig()
+    self.sleep = sleep
+    self.rand = rand
+    adapter = HTTPAdapter(pool_connections=self.config.pool_connections,
+                          pool_maxsize=self.config.pool_maxsize)
+    self.mount('https://', adapter)
+    self.mount('http://', adapter)
+    self.headers['Accept-Encoding'] = 'gzip, deflate'
+    self.headers['Connection'] = 'keep-alive'
+
+  def request(self, method, url, *args, **kwargs):
+    if kwargs.get('timeout', None) is None:
+      kwargs['timeout'] = self.config.timeout
+    retries = self.config.max_retries if self.IsRetryable(method, url) else 0
+    attempt = 0
+    while True:
+      try:
+        resp = super().request(method, url, *args, **kwargs)
+        if (attempt >= retries or
+            resp.status_code not in self.config.retry_statuses):
+          return resp
+        # Release the connection back to the pool before retrying.
+        resp.close()
+      except (requests.ConnectionError, requests.Timeout):
+        if attempt >= retries:
+          raise
+      self.sleep(self.Backoff(attempt))
+      attempt += 1
+
+  def Backoff(self, attempt):
+    return self.rand() * min(self.config.backoff_max_secs,
+                             self.config.backoff_base_secs * 2 ** attempt)
+
+  @staticmethod
+  def IsRetryable(method, url):
+    if method.upper() in ('GET', 'HEAD', 'OPTIONS'):
+      return True
+    path = urlparse(url).path
+    return any(path.endswith(write) for write in IDEMPOTENT_WRITES)
+
+
+def ConfigureApi(api, config=None):
+  '''Routes all requests made by a twitter.Api through a RetryingSession.'''
+  api._session = RetryingSession(config)
+  return api
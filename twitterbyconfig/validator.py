@@ -0,0 +1,130 @@
+import collections
+import yaml
+
+from twitterbyconfig.configloader import (
+    ConfigLoader,
+)
+
+from twitterbyconfig.models import (
+    META_LIST_PREFIX,
+)
+
+
+class ConfigValidator:
+  '''Checks a config for errors without contacting Twitter.
+
+  Unlike TwitterAccount.FromConfigDict, which stops at the first problem,
+  every error found is reported so a config can be fixed in one pass.
+  '''
+  def __init__(self, cache=None):
+    self.cache = cache
+
+  def ValidateFile(self, config_file):
+    '''Returns a list of error messages, empty when the config is valid.'''
+    try:
+      config = ConfigLoader(cache=self.cache).Load(config_file)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+      return ['Unable to load {0}: {1}'.format(config_file, e)]
+    return self.Validate(config)
+
+  def Validate(self, config):
+    errors = []
+    follows = self._ValidateUsers(config.get('follows', []), 'follows', errors)
+    blocks = self._ValidateUsers(config.get('blocks', []), 'blocks', errors)
+    self._ValidateUsers(config.get('mutes', []), 'mutes', errors)
+    for username in sorted(follows & blocks):
+      errors.append('@{0} is both followed and blocked'.format(username))
+    lists = config.get('lists', [])
+    list_names = set()
+    if _IsList(lists, 'lists', errors):
+      list_names = self._ValidateLists(lists, errors)
+    meta_lists = config.get('meta_lists', [])
+    if _IsList(meta_lists, 'meta_lists', errors):
+      self._ValidateMetaLists(meta_lists, list_names, errors)
+    return errors
+
+  def _ValidateUsers(self, users, context, errors):
+    '''Returns the lowercased usernames, Twitter ignores username case.'''
+    if not _IsList(users, context, errors):
+      return set()
+    usernames = []
+    for user in users:
+      if not isinstance(user, dict) or not user.get('username'):
+        errors.append('Entry in {0} has no username: {1}'.format(context,
+                                                                 user))
+      else:
+        usernames.append(user['username'].lower())
+    for username in _Duplicates(usernames):
+      errors.append('Duplicate @{0} in {1}'.format(username, context))
+    return set(usernames)
+
+  def _ValidateLists(self, lists, errors):
+    names = []
+    for l in lists:
+      name = l.get('name') if isinstance(l, dict) else None
+      if not name:
+        errors.append('List has no name: {0}'.format(l))
+        continue
+      names.append(name)
+      if name.startswith(META_LIST_PREFIX):
+        errors.append(
+            'List "{0}" conflicts with meta-list requirements, names starting'
+            ' with {1} are reserved for meta_lists'.format(name,
+                                                          META_LIST_PREFIX))
+      if 'members' not in l:
+        errors.append('List "{0}" has no members'.format(name))
+        continue
+      self._ValidateUsers(l['members'], 'Members of list "{0}"'.format(name),
+                          errors)
+    for name in _Duplicates(names):
+      errors.append('Duplicate list "{0}"'.format(name))
+    return set(names)
+
+  def _ValidateMetaLists(self, meta_lists, list_names, errors):
+    for ml in meta_lists:
+      if not isinstance(ml, dict) or not ml.get('name'):
+        errors.append('Meta-list has no name: {0}'.format(ml))
+    meta_lists = [ml for ml in meta_lists
+                  if isinstance(ml, dict) and ml.get('name')]
+    names = [ml['name'] for ml in meta_lists]
+    meta_list_names = set(names)
+    for name in _Duplicates(names):
+      errors.append('Duplicate meta-list "{0}"'.format(name))
+    for ml in meta_lists:
+      name = ml['name']
+      if not name.startswith(META_LIST_PREFIX):
+        errors.append('Invalid meta-list name ({0}), must start with: '
+                      '{1}'.format(name, META_LIST_PREFIX))
+      if 'is_private' not in ml:
+        errors.append('Meta-list "{0}" has no is_private'.format(name))
+      if not ml.get('lists'):
+        errors.append('Meta-list "{0}" has no lists'.format(name))
+        continue
+      if not _IsList(ml['lists'], 'Lists of meta-list "{0}"'.format(name),
+                     errors):
+        continue
+      for list_name in _Duplicates(ml['lists']):
+        errors.append('Meta-list "{0}" includes list "{1}" more than '
+                      'once'.format(name, list_name))
+      for list_name in ml['lists']:
+        if list_name == name:
+          errors.append('Meta-list "{0}" includes itself'.format(name))
+        elif list_name in meta_list_names:
+          errors.append('Meta-list "{0}" includes meta-list "{1}", meta-lists'
+                        ' can only include lists'.format(name, list_name))
+        elif list_name not in list_names:
+          errors.append('Meta-list "{0}" includes undefined list '
+                        '"{1}"'.format(name, list_name))
+
+
+def _IsList(value, context, errors):
+  '''Reports a section which is not a YAML sequence, e.g. left empty.'''
+  if isinstance(value, list):
+    return True
+  errors.append('{0} must be a list, got: {1}'.format(context, value))
+  return False
+
+
+def _Duplicates(values):
+  return sorted(value for value, count in collections.Counter(values).items()
+                if count > 1)